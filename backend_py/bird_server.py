@@ -5,16 +5,23 @@ Provides MJPEG streaming, status reporting, and video upload endpoints
 
 import os
 import shutil
+import time
+import heapq
 import asyncio
-from typing import Optional
+import functools
+from typing import AsyncIterator, Optional, Tuple
 from datetime import datetime
 from pathlib import Path
 
-from fastapi import APIRouter, UploadFile, File, HTTPException, Response
+import aiofiles
+from fastapi import APIRouter, HTTPException, Request, Response
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from starlette.datastructures import UploadFile
 
 from detector import BirdDetector
+from services.frame_streamer import BackgroundStreamer, create_mjpeg_frame
+from utils.image_processing import encode_jpeg, fast_b64encode
 
 
 # ============================================================================
@@ -26,6 +33,8 @@ UPLOAD_DIR.mkdir(exist_ok=True)
 
 ALLOWED_VIDEO_EXTENSIONS = {".mp4", ".avi", ".mov", ".mkv", ".webm", ".m4v"}
 MAX_FILE_SIZE_MB = 500  # Maximum upload size in MB
+UPLOAD_WRITE_SIZE = 1024 * 1024  # Flush uploads to disk in 1MB blocks
+MAX_THUMB_AGE_S = 30.0  # Detection thumbnails older than this are not returned
 
 
 # ============================================================================
@@ -69,13 +78,67 @@ def get_detector() -> BirdDetector:
         _detector = BirdDetector(
             model_path="yolov8n.pt",
             confidence_threshold=0.35,  # Lowered for better detection
-            cooldown_seconds=3.0  # Faster alerts
+            cooldown_seconds=3.0,  # Faster alerts
+            precision=os.environ.get("BIRD_MODEL_PRECISION", "fp32")
         )
     return _detector
 
 
-# Store latest detection frame for thumbnails
-_latest_detection_frame: Optional[bytes] = None
+# Latest detection frame for thumbnails as (jpeg_bytes, monotonic timestamp).
+# The bytes are the same JPEG the MJPEG stream sent; no second encode.
+_latest_detection: Optional[Tuple[bytes, float]] = None
+
+# (jpeg_bytes, base64) of the last thumbnail served, encoded once per frame
+_thumbnail_b64_cache: Optional[Tuple[bytes, str]] = None
+
+
+def _clear_thumbnail():
+    """Evict the cached detection thumbnail (source released or replaced)"""
+    global _latest_detection, _thumbnail_b64_cache
+    _latest_detection = None
+    _thumbnail_b64_cache = None
+
+
+class BirdStreamer(BackgroundStreamer):
+    """
+    Shared capture + inference thread for the bird /feed.
+    
+    Publishes annotated frames at ~20 FPS and stops when the video
+    source ends or no client is watching.
+    """
+    
+    THREAD_NAME = "bird-stream"
+    
+    def __init__(self, detector: BirdDetector, fps: float = 20):
+        super().__init__()
+        self.detector = detector
+        self.frame_delay = 1 / fps
+        
+    def produce(self) -> bool:
+        global _latest_detection
+        batch = self.detector.process_batch()
+        if not batch:
+            return False
+            
+        for frame_bytes, bird_detected in batch:
+            # Store frame for thumbnail if bird detected
+            if bird_detected:
+                _latest_detection = (frame_bytes, time.monotonic())
+                
+            self.publish(frame_bytes)
+            time.sleep(self.frame_delay)
+        return True
+
+
+_streamer: Optional[BirdStreamer] = None
+
+
+def get_streamer() -> BirdStreamer:
+    """Get or create the shared background streamer"""
+    global _streamer
+    if _streamer is None:
+        _streamer = BirdStreamer(get_detector())
+    return _streamer
 
 
 # ============================================================================
@@ -97,15 +160,20 @@ async def get_status():
     - alert_active: Whether deterrent alert should be triggered
     - thumbnail: Base64 JPEG of latest detection frame
     """
-    global _latest_detection_frame
+    global _thumbnail_b64_cache
     detector = get_detector()
     status = detector.get_status()
     
-    # Include thumbnail if we have a detection frame
+    # Include thumbnail if we have a recent detection frame
     thumbnail_b64 = None
-    if _latest_detection_frame and status["detected"]:
-        import base64
-        thumbnail_b64 = base64.b64encode(_latest_detection_frame).decode('utf-8')
+    latest = _latest_detection
+    if latest and status["detected"] and time.monotonic() - latest[1] <= MAX_THUMB_AGE_S:
+        frame_bytes = latest[0]
+        cached = _thumbnail_b64_cache
+        if cached is None or cached[0] is not frame_bytes:
+            cached = (frame_bytes, fast_b64encode(frame_bytes))
+            _thumbnail_b64_cache = cached
+        thumbnail_b64 = cached[1]
     
     return StatusResponse(
         **status,
@@ -132,56 +200,46 @@ async def get_feed():
         )
     
     return StreamingResponse(
-        _generate_frames(detector),
+        _generate_frames(get_streamer()),
         media_type="multipart/x-mixed-replace; boundary=frame"
     )
 
 
-async def _generate_frames(detector: BirdDetector):
+async def _generate_frames(streamer: BirdStreamer):
     """
     Async generator for MJPEG frames.
     
-    Yields JPEG frames at approximately 20 FPS to balance
-    responsiveness with CPU usage.
+    Each client waits for the shared streamer to publish a newer frame
+    and sends only the latest one, so slow clients drop frames instead
+    of adding capture/inference work. The generator is only resumed once
+    the previous chunk has been handed to the transport, so pacing follows
+    the client (never faster than the streamer publishes).
     """
-    global _latest_detection_frame
-    frame_delay = 1 / 20  # Target 20 FPS
+    streamer.start()
+    frame_id = streamer.frame_id
     
     while True:
         try:
-            frame_bytes = detector.process_frame()
+            new_id, frame_bytes = await streamer.wait_for_frame(frame_id)
             
-            if frame_bytes is None:
+            if new_id == frame_id:
+                if streamer.running:
+                    continue
                 # No more frames, yield placeholder then stop
-                yield _create_mjpeg_frame(_generate_placeholder_frame())
+                yield create_mjpeg_frame(_generate_placeholder_frame())
                 break
             
-            # Store frame for thumbnail if bird detected
-            if detector.state.detected:
-                _latest_detection_frame = frame_bytes
-                
-            yield _create_mjpeg_frame(frame_bytes)
-            
-            # Small delay to control frame rate and allow other coroutines
-            await asyncio.sleep(frame_delay)
+            frame_id = new_id
+            yield create_mjpeg_frame(frame_bytes)
             
         except Exception as e:
             print(f"Frame generation error: {e}")
             break
 
 
-def _create_mjpeg_frame(jpeg_bytes: bytes) -> bytes:
-    """Create an MJPEG frame with proper boundary markers"""
-    return (
-        b"--frame\r\n"
-        b"Content-Type: image/jpeg\r\n\r\n" +
-        jpeg_bytes +
-        b"\r\n"
-    )
-
-
+@functools.lru_cache(maxsize=1)
 def _generate_placeholder_frame() -> bytes:
-    """Generate a placeholder frame when no video source is active"""
+    """Generate a placeholder frame when no video source is active (rendered once)"""
     import cv2
     import numpy as np
     
@@ -207,24 +265,60 @@ def _generate_placeholder_frame() -> bytes:
     cv2.circle(frame, (320, 200), 40, (80, 80, 90), 2)
     
     # Encode to JPEG
-    _, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
-    return jpeg.tobytes()
+    return encode_jpeg(frame, quality=85)
+
+
+async def _iter_upload_file(upload: UploadFile) -> AsyncIterator[bytes]:
+    """Read a multipart upload in UPLOAD_WRITE_SIZE chunks"""
+    while True:
+        chunk = await upload.read(UPLOAD_WRITE_SIZE)
+        if not chunk:
+            break
+        yield chunk
 
 
 @router.post("/upload", response_model=UploadResponse)
-async def upload_video(file: UploadFile = File(...)):
+async def upload_video(request: Request, filename: Optional[str] = None):
     """
     Upload a video file for bird detection analysis.
     
+    Accepts either:
+    - ``multipart/form-data`` with the video under the ``file`` key, or
+    - the raw video bytes as the request body, with the original name passed
+      as ``?filename=`` (or an ``X-Filename`` header). The body is streamed
+      straight to disk without multipart buffering.
+    
     The uploaded video becomes the active source for the /feed endpoint.
     Supports MP4, AVI, MOV, MKV, WEBM, and M4V formats.
     Maximum file size: 500MB
     """
+    form = None
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if not isinstance(upload, UploadFile):
+            await form.close()
+            raise HTTPException(400, "No file provided")
+        filename = upload.filename
+        chunks = _iter_upload_file(upload)
+    else:
+        filename = filename or request.headers.get("x-filename")
+        chunks = request.stream()
+    
+    try:
+        return await _save_upload(filename, chunks)
+    finally:
+        if form is not None:
+            await form.close()
+
+
+async def _save_upload(filename: Optional[str], chunks: AsyncIterator[bytes]) -> UploadResponse:
+    """Validate the name, stream ``chunks`` to UPLOAD_DIR and make the video the active source"""
     # Validate file extension
-    if not file.filename:
+    if not filename:
         raise HTTPException(400, "No filename provided")
         
-    ext = Path(file.filename).suffix.lower()
+    ext = Path(filename).suffix.lower()
     if ext not in ALLOWED_VIDEO_EXTENSIONS:
         raise HTTPException(
             400,
@@ -237,30 +331,32 @@ async def upload_video(file: UploadFile = File(...)):
     file_path = UPLOAD_DIR / safe_filename
     
     try:
-        # Save uploaded file
-        with open(file_path, "wb") as buffer:
-            # Read in chunks to handle large files
-            chunk_size = 1024 * 1024  # 1MB chunks
-            total_size = 0
-            max_size = MAX_FILE_SIZE_MB * 1024 * 1024
-            
-            while True:
-                chunk = await file.read(chunk_size)
-                if not chunk:
-                    break
-                    
+        # Stream the request body to disk
+        total_size = 0
+        max_size = MAX_FILE_SIZE_MB * 1024 * 1024
+        
+        # ASGI servers hand us ~64KB body chunks; coalesce them so each
+        # thread-pool write moves a full UPLOAD_WRITE_SIZE block
+        pending = bytearray()
+        
+        async with aiofiles.open(file_path, "wb") as buffer:
+            async for chunk in chunks:
                 total_size += len(chunk)
                 if total_size > max_size:
-                    # Clean up and reject
-                    buffer.close()
-                    file_path.unlink(missing_ok=True)
                     raise HTTPException(413, f"File too large. Maximum size: {MAX_FILE_SIZE_MB}MB")
                     
-                buffer.write(chunk)
+                pending += chunk
+                if len(pending) >= UPLOAD_WRITE_SIZE:
+                    await buffer.write(pending)
+                    pending.clear()
+            
+            if pending:
+                await buffer.write(pending)
         
         # Set as active video source
         detector = get_detector()
         success = detector.set_video_source(str(file_path))
+        _clear_thumbnail()
         
         if not success:
             file_path.unlink(missing_ok=True)
@@ -273,6 +369,8 @@ async def upload_video(file: UploadFile = File(...)):
         )
         
     except HTTPException:
+        # Clean up partial/rejected uploads
+        file_path.unlink(missing_ok=True)
         raise
     except Exception as e:
         # Clean up on error
@@ -281,6 +379,18 @@ async def upload_video(file: UploadFile = File(...)):
         raise HTTPException(500, f"Upload failed: {str(e)}")
 
 
+def _cleanup_uploads(keep: int):
+    """Delete all but the ``keep`` most recent uploaded videos"""
+    with os.scandir(UPLOAD_DIR) as it:
+        entries = [e for e in it if e.name.startswith("bird_video_")]
+        
+    newest = heapq.nlargest(keep, entries, key=lambda e: e.stat().st_mtime)
+    keep_paths = {e.path for e in newest}
+    for entry in entries:
+        if entry.path not in keep_paths:
+            Path(entry.path).unlink(missing_ok=True)
+
+
 @router.post("/reset", response_model=ResetResponse)
 async def reset_detector():
     """
@@ -291,12 +401,11 @@ async def reset_detector():
     """
     detector = get_detector()
     detector.release_video_source()
+    _clear_thumbnail()
     
     # Clean up old uploaded files (keep last 5)
     try:
-        files = sorted(UPLOAD_DIR.glob("bird_video_*"), key=os.path.getmtime, reverse=True)
-        for old_file in files[5:]:  # Keep only the 5 most recent
-            old_file.unlink(missing_ok=True)
+        await asyncio.to_thread(_cleanup_uploads, 5)
     except Exception as e:
         print(f"Cleanup warning: {e}")
     
@@ -3,56 +3,133 @@ Bird Detector Module - YOLOv8 wrapper for real-time bird detection
 Uses COCO class 14 (bird) with configurable confidence threshold
 """
 
+import functools
 import threading
+from pathlib import Path
 from datetime import datetime, timedelta
-from typing import Optional, Tuple
+from typing import List, Literal, Optional, Tuple
 from dataclasses import dataclass, field
 
 import cv2
 import numpy as np
+import torch
 from ultralytics import YOLO
 
+from utils.image_processing import encode_jpeg
+
+
+# Bird boxes as (xyxy int32 array of shape (N, 4), confidence array of shape (N,))
+Birds = Tuple[np.ndarray, np.ndarray]
+NO_BIRDS: Birds = (np.empty((0, 4), dtype=np.int32), np.empty(0, dtype=np.float32))
+
+
+BOX_COLOR = (0, 0, 255)  # BGR Red
+
+
+def _draw_boxes(frame: np.ndarray, xyxy: np.ndarray, conf: np.ndarray, thickness: int, font_scale: float):
+    """Draw bird boxes and confidence labels in place"""
+    # All box outlines in a single polylines call
+    x1, y1, x2, y2 = xyxy.T
+    corners = np.stack([
+        np.stack([x1, y1], axis=1),
+        np.stack([x2, y1], axis=1),
+        np.stack([x2, y2], axis=1),
+        np.stack([x1, y2], axis=1),
+    ], axis=1)
+    cv2.polylines(frame, list(corners), True, BOX_COLOR, thickness)
+    
+    # Labels with confidence, blitted from pre-rendered sprites
+    label_thickness = max(1, int(font_scale * 2))
+    frame_h, frame_w = frame.shape[:2]
+    for (x1, y1, _, _), confidence in zip(xyxy.tolist(), conf.tolist()):
+        sprite = _label_sprite(f"BIRD {confidence:.0%}", font_scale, label_thickness)
+        sprite_h, sprite_w = sprite.shape[:2]
+        
+        # Sprite's bottom-left corner sits on the box's top-left corner; clip to the frame
+        top, left = y1 - sprite_h + 1, x1
+        y_start, x_start = max(top, 0), max(left, 0)
+        y_end, x_end = min(top + sprite_h, frame_h), min(left + sprite_w, frame_w)
+        if y_start >= y_end or x_start >= x_end:
+            continue
+        frame[y_start:y_end, x_start:x_end] = sprite[
+            y_start - top:y_end - top, x_start - left:x_end - left
+        ]
+
+
+@functools.lru_cache(maxsize=512)
+def _label_sprite(label: str, font_scale: float, label_thickness: int) -> np.ndarray:
+    """Render a label (filled background + white text) once; callers must not mutate it"""
+    (label_w, label_h), baseline = cv2.getTextSize(
+        label, cv2.FONT_HERSHEY_SIMPLEX, font_scale, label_thickness
+    )
+    sprite = np.empty((label_h + 11, label_w + 11, 3), dtype=np.uint8)
+    sprite[:] = BOX_COLOR
+    cv2.putText(
+        sprite,
+        label,
+        (5, label_h + 5),
+        cv2.FONT_HERSHEY_SIMPLEX,
+        font_scale,
+        (255, 255, 255),  # White text
+        label_thickness
+    )
+    return sprite
+
 
 @dataclass
 class DetectionState:
-    """Thread-safe detection state container"""
-    detected: bool = False
-    last_detected: Optional[datetime] = None
-    confidence: float = 0.0
-    alert_active: bool = False
+    """
+    Thread-safe detection state container.
+    
+    The state lives in one immutable snapshot tuple. Writers build a new
+    tuple under the lock; readers load the attribute once (atomic under
+    the GIL) and never block.
+    """
+    # (detected, last_detected, confidence, alert_active)
+    _snapshot: Tuple[bool, Optional[datetime], float, bool] = (False, None, 0.0, False)
     _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
     
+    @property
+    def detected(self) -> bool:
+        return self._snapshot[0]
+    
+    @property
+    def last_detected(self) -> Optional[datetime]:
+        return self._snapshot[1]
+    
+    @property
+    def confidence(self) -> float:
+        return self._snapshot[2]
+    
+    @property
+    def alert_active(self) -> bool:
+        return self._snapshot[3]
+    
     def update(self, detected: bool, confidence: float = 0.0, cooldown_seconds: float = 5.0):
-        """Update detection state with thread safety"""
+        """Update detection state; the lock only serializes writers"""
         with self._lock:
             now = datetime.now()
-            self.detected = detected
+            last_detected = self._snapshot[1]
             
             if detected:
-                self.confidence = confidence
-                
                 # Check if cooldown has passed for alert
-                if self.last_detected is None:
-                    self.alert_active = True
-                elif (now - self.last_detected) >= timedelta(seconds=cooldown_seconds):
-                    self.alert_active = True
-                else:
-                    self.alert_active = False
-                    
-                self.last_detected = now
+                alert_active = (
+                    last_detected is None
+                    or (now - last_detected) >= timedelta(seconds=cooldown_seconds)
+                )
+                self._snapshot = (True, now, confidence, alert_active)
             else:
-                self.confidence = 0.0
-                self.alert_active = False
+                self._snapshot = (False, last_detected, 0.0, False)
     
     def to_dict(self) -> dict:
-        """Convert to JSON-serializable dictionary"""
-        with self._lock:
-            return {
-                "detected": self.detected,
-                "last_detected": self.last_detected.isoformat() if self.last_detected else None,
-                "confidence": round(self.confidence, 4),
-                "alert_active": self.alert_active
-            }
+        """Convert to JSON-serializable dictionary (lock-free)"""
+        detected, last_detected, confidence, alert_active = self._snapshot
+        return {
+            "detected": detected,
+            "last_detected": last_detected.isoformat() if last_detected else None,
+            "confidence": round(confidence, 4),
+            "alert_active": alert_active
+        }
 
 
 class BirdDetector:
@@ -72,7 +149,12 @@ class BirdDetector:
         self,
         model_path: str = "yolov8n.pt",
         confidence_threshold: float = 0.5,
-        cooldown_seconds: float = 5.0
+        cooldown_seconds: float = 5.0,
+        batch_size: int = 4,
+        precision: Literal["fp32", "fp16", "int8"] = "fp32",
+        calibration_data: str = "coco8.yaml",
+        imgsz: int = 416,
+        motion_threshold: float = 0.005
     ):
         """
         Initialize the bird detector.
@@ -81,16 +163,74 @@ class BirdDetector:
             model_path: Path to YOLOv8 model weights
             confidence_threshold: Minimum confidence for detection (0.0-1.0)
             cooldown_seconds: Cooldown period between alerts
+            batch_size: Frames per YOLO call when streaming
+            precision: Inference precision; "fp16" runs half precision on GPU,
+                "int8" exports a TensorRT engine (GPU) or OpenVINO model (CPU)
+                calibrated on calibration_data
+            calibration_data: Dataset YAML used for INT8 calibration
+            imgsz: YOLO input size (boxes are returned in frame coordinates)
+            motion_threshold: Fraction of changed pixels below which a frame
+                reuses the previous detections instead of running YOLO
         """
         self.model = YOLO(model_path)
+        self.precision = precision
+        self._half = precision == "fp16"
+        
+        if precision == "int8":
+            try:
+                self.model = YOLO(
+                    self._export_int8(model_path, max(1, batch_size), imgsz, calibration_data),
+                    task="detect"
+                )
+            except Exception as e:
+                print(f"INT8 export failed, using FP32 weights: {e}")
+                self.precision = "fp32"
+                
         self.confidence_threshold = confidence_threshold
         self.cooldown_seconds = cooldown_seconds
+        self.batch_size = max(1, batch_size)
+        self.imgsz = imgsz
+        self.motion_threshold = motion_threshold
         self.state = DetectionState()
         
+        # Motion gate: last analysed thumbnail and the birds found in it
+        self._prev_gray: Optional[np.ndarray] = None
+        self._last_birds: Birds = NO_BIRDS
+        
         # Video source management
         self._video_source: Optional[cv2.VideoCapture] = None
         self._video_lock = threading.Lock()
+        self._read_lock = threading.Lock()  # Held while decoding; handles are released under it
+        self._generation = 0  # Bumped whenever the handle is swapped or released
         self._source_path: Optional[str] = None
+        self._grab_budget = 0  # > 0 for live sources: grabs per read to reach the newest frame
+        
+    def _export_int8(self, model_path: str, batch_size: int, imgsz: int, calibration_data: str) -> str:
+        """
+        Export (once) an INT8 model for this host and return its path.
+        
+        CUDA hosts get a TensorRT engine; CPU-only hosts get an OpenVINO
+        INT8 model, which uses VNNI int8 dot products on x86. Exports are
+        built for the streaming batch size and input size, and both are part
+        of the export name, so an existing export next to the weights is
+        only reused (instead of re-calibrating) when its shapes match.
+        """
+        weights = Path(model_path)
+        tag = f"int8_b{batch_size}_{imgsz}"
+        if torch.cuda.is_available():
+            exported = weights.with_name(f"{weights.stem}_{tag}.engine")
+            export_args = dict(format="engine")
+        else:
+            exported = weights.with_name(f"{weights.stem}_{tag}_openvino_model")
+            export_args = dict(format="openvino")
+        if exported.exists():
+            return str(exported)
+        output = self.model.export(
+            int8=True, data=calibration_data, imgsz=imgsz, batch=batch_size, dynamic=True, **export_args
+        )
+        # Ultralytics names exports after the weights only; move it to the shape-tagged name
+        Path(output).rename(exported)
+        return str(exported)
         
     def set_video_source(self, source: str) -> bool:
         """
@@ -102,62 +242,110 @@ class BirdDetector:
         Returns:
             True if source was opened successfully
         """
-        with self._video_lock:
-            # Release existing source
-            if self._video_source is not None:
-                self._video_source.release()
+        # Open the new source outside the lock (opening can be slow)
+        capture = None
+        grab_budget = 0
+        try:
+            if source.isdigit():
+                capture = cv2.VideoCapture(int(source))
+            else:
+                capture = cv2.VideoCapture(source)
                 
-            # Open new source
-            try:
-                if source.isdigit():
-                    self._video_source = cv2.VideoCapture(int(source))
-                else:
-                    self._video_source = cv2.VideoCapture(source)
-                    
-                if not self._video_source.isOpened():
-                    self._video_source = None
-                    self._source_path = None
-                    return False
-                    
-                self._source_path = source
-                return True
+            if capture.isOpened():
+                # Live sources: keep only the latest frame queued. If the
+                # backend ignores the buffer size, drain a few frames per read.
+                if self._is_live_source(source):
+                    buffer_set = capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+                    grab_budget = 1 if buffer_set else 3
+            else:
+                capture.release()
+                capture = None
                 
-            except Exception as e:
-                print(f"Error opening video source: {e}")
-                self._video_source = None
-                self._source_path = None
-                return False
+        except Exception as e:
+            print(f"Error opening video source: {e}")
+            if capture is not None:
+                capture.release()
+            capture = None
+            
+        # Swap handles in one step, so overlapping calls each release exactly
+        # the handle they replaced. A failed open leaves no active source.
+        with self._video_lock:
+            previous = self._video_source
+            self._video_source = capture
+            self._source_path = source if capture is not None else None
+            self._grab_budget = grab_budget
+            self._generation += 1
+            self._prev_gray = None
+            self._last_birds = NO_BIRDS
+            
+        # Wait for an in-flight read before tearing the old handle down
+        if previous is not None:
+            with self._read_lock:
+                previous.release()
+        return capture is not None
     
     def release_video_source(self):
         """Release the current video source"""
         with self._video_lock:
-            if self._video_source is not None:
-                self._video_source.release()
-                self._video_source = None
-                self._source_path = None
-                
+            capture = self._video_source
+            self._video_source = None
+            self._source_path = None
+            self._generation += 1
+            
             # Reset detection state
             self.state = DetectionState()
+            self._prev_gray = None
+            self._last_birds = NO_BIRDS
+            
+        # Wait for an in-flight read before tearing the handle down
+        if capture is not None:
+            with self._read_lock:
+                capture.release()
     
     def read_frame(self) -> Tuple[bool, Optional[np.ndarray]]:
         """
         Read a frame from the current video source.
         
+        The source lock is only held to snapshot the handle; decoding runs
+        under a separate read lock so status/reset calls never wait on it.
+        
         Returns:
             Tuple of (success, frame)
         """
-        with self._video_lock:
-            if self._video_source is None:
-                return False, None
+        while True:
+            with self._video_lock:
+                capture = self._video_source
+                if capture is None:
+                    return False, None
+                generation = self._generation
+                grab_budget = self._grab_budget
+                source_path = self._source_path
                 
-            ret, frame = self._video_source.read()
-            
-            # Loop video if end is reached (for uploaded files)
-            if not ret and self._source_path and not self._source_path.isdigit():
-                self._video_source.set(cv2.CAP_PROP_POS_FRAMES, 0)
-                ret, frame = self._video_source.read()
+            with self._read_lock:
+                # Source swapped while we waited: retry with the new handle
+                if generation != self._generation:
+                    continue
+                    
+                if grab_budget:
+                    # Skip stale buffered frames, decode only the newest one
+                    for _ in range(grab_budget):
+                        if not capture.grab():
+                            break
+                    ret, frame = capture.retrieve()
+                else:
+                    ret, frame = capture.read()
                 
-            return ret, frame
+                # Loop video if end is reached (for uploaded files)
+                if not ret and source_path and not source_path.isdigit():
+                    capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    ret, frame = capture.read()
+                    
+                return ret, frame
+    
+    @staticmethod
+    def _is_live_source(source: str) -> bool:
+        """Webcam indices and network streams produce frames in real time"""
+        return source.isdigit() or "://" in source
     
     def detect_birds(self, frame: np.ndarray) -> Tuple[np.ndarray, bool, float]:
         """
@@ -169,64 +357,95 @@ class BirdDetector:
         Returns:
             Tuple of (annotated_frame, bird_detected, max_confidence)
         """
-        # Run inference
-        results = self.model(frame, verbose=False, conf=self.confidence_threshold)
+        return self.detect_birds_batch([frame])[0]
+    
+    def detect_birds_batch(self, frames: List[np.ndarray]) -> List[Tuple[np.ndarray, bool, float]]:
+        """
+        Detect birds in several frames with a single YOLO call.
         
-        bird_detected = False
-        max_confidence = 0.0
-        annotated_frame = frame.copy()
+        Frames that barely differ from the last analysed frame skip YOLO
+        and reuse its boxes; the rest run at ``imgsz`` resolution.
         
-        for result in results:
-            boxes = result.boxes
+        Args:
+            frames: Input BGR images from OpenCV, in playback order
             
-            for box in boxes:
-                class_id = int(box.cls[0])
-                confidence = float(box.conf[0])
+        Returns:
+            List of (annotated_frame, bird_detected, max_confidence) per frame
+        """
+        # Only frames with enough motion go through the model
+        moving = [i for i, frame in enumerate(frames) if self._has_motion(frame)]
+        
+        # Run inference once for the whole batch
+        results = {}
+        if moving:
+            batch_results = self.model(
+                [frames[i] for i in moving],
+                verbose=False,
+                conf=self.confidence_threshold,
+                half=self._half,
+                imgsz=self.imgsz
+            )
+            results = dict(zip(moving, batch_results))
+        
+        detections = []
+        for i, frame in enumerate(frames):
+            if i in results:
+                self._last_birds = self._extract_birds(results[i])
+            detection = self._annotate(frame, self._last_birds)
+            
+            # Update detection state in frame order
+            self.state.update(detection[1], detection[2], self.cooldown_seconds)
+            detections.append(detection)
+            
+        return detections
+    
+    def _has_motion(self, frame: np.ndarray) -> bool:
+        """Cheap frame-difference gate on a 160x120 grayscale thumbnail"""
+        small = cv2.resize(frame, (160, 120), interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        
+        if self._prev_gray is not None:
+            diff = cv2.absdiff(gray, self._prev_gray)
+            _, changed = cv2.threshold(diff, 20, 255, cv2.THRESH_BINARY)
+            if cv2.countNonZero(changed) < self.motion_threshold * gray.size:
+                return False
                 
-                # Check if it's a bird
-                if class_id == self.BIRD_CLASS_ID:
-                    bird_detected = True
-                    max_confidence = max(max_confidence, confidence)
-                    
-                    # Draw bounding box
-                    x1, y1, x2, y2 = map(int, box.xyxy[0])
-                    
-                    # Red color for bird detection with dynamic thickness
-                    color = (0, 0, 255)  # BGR Red
-                    thickness = max(2, int(min(frame.shape[:2]) / 200))
-                    
-                    cv2.rectangle(annotated_frame, (x1, y1), (x2, y2), color, thickness)
-                    
-                    # Label with confidence
-                    label = f"BIRD {confidence:.0%}"
-                    font_scale = max(0.5, min(frame.shape[:2]) / 800)
-                    label_thickness = max(1, int(font_scale * 2))
-                    
-                    # Background for label
-                    (label_w, label_h), baseline = cv2.getTextSize(
-                        label, cv2.FONT_HERSHEY_SIMPLEX, font_scale, label_thickness
-                    )
-                    cv2.rectangle(
-                        annotated_frame,
-                        (x1, y1 - label_h - 10),
-                        (x1 + label_w + 10, y1),
-                        color,
-                        -1
-                    )
-                    cv2.putText(
-                        annotated_frame,
-                        label,
-                        (x1 + 5, y1 - 5),
-                        cv2.FONT_HERSHEY_SIMPLEX,
-                        font_scale,
-                        (255, 255, 255),  # White text
-                        label_thickness
-                    )
+        # Compare later frames against the last analysed one
+        self._prev_gray = gray
+        return True
+    
+    def _extract_birds(self, result) -> Birds:
+        """Filter a YOLO result down to bird boxes with one tensor->NumPy transfer per field"""
+        boxes = result.boxes
+        cls = boxes.cls.cpu().numpy().astype(np.int32)
+        mask = cls == self.BIRD_CLASS_ID
+        if not mask.any():
+            return NO_BIRDS
+            
+        xyxy = boxes.xyxy.cpu().numpy()[mask].astype(np.int32)
+        conf = boxes.conf.cpu().numpy()[mask]
+        return xyxy, conf
+    
+    def _annotate(self, frame: np.ndarray, birds: Birds) -> Tuple[np.ndarray, bool, float]:
+        """
+        Draw bird boxes onto a copy of the frame.
+        
+        Frames without birds are returned as-is (no copy), so callers
+        must not mutate the returned array.
+        """
+        xyxy, conf = birds
+        if not len(conf):
+            return frame, False, 0.0
+            
+        max_confidence = float(conf.max())
+        annotated_frame = frame.copy()
         
-        # Update detection state
-        self.state.update(bird_detected, max_confidence, self.cooldown_seconds)
+        # Dynamic thickness / font size based on frame size
+        thickness = max(2, int(min(frame.shape[:2]) / 200))
+        font_scale = max(0.5, min(frame.shape[:2]) / 800)
+        _draw_boxes(annotated_frame, xyxy, conf, thickness, font_scale)
         
-        return annotated_frame, bird_detected, max_confidence
+        return annotated_frame, True, max_confidence
     
     def process_frame(self) -> Optional[bytes]:
         """
@@ -235,19 +454,41 @@ class BirdDetector:
         Returns:
             JPEG encoded frame bytes, or None if no frame available
         """
-        ret, frame = self.read_frame()
+        frames = self.process_batch(max_frames=1)
+        return frames[0][0] if frames else None
+    
+    def process_batch(self, max_frames: Optional[int] = None) -> List[Tuple[bytes, bool]]:
+        """
+        Read up to ``batch_size`` frames, run one batched inference and
+        return the annotated frames as JPEG bytes in playback order.
+        
+        Live sources read a single frame by default: collecting a batch
+        would hold the newest frame back by several camera frame periods.
         
-        if not ret or frame is None:
-            return None
+        Returns:
+            List of (jpeg_bytes, bird_detected) per frame (empty if no frame available)
+        """
+        if max_frames is None:
+            max_frames = 1 if self._grab_budget else self.batch_size
+            
+        frames = []
+        for _ in range(max_frames):
+            ret, frame = self.read_frame()
+            if not ret or frame is None:
+                break
+            frames.append(frame)
+            
+        if not frames:
+            return []
             
         # Detect and annotate
-        annotated_frame, _, _ = self.detect_birds(frame)
+        detections = self.detect_birds_batch(frames)
         
         # Encode to JPEG
-        encode_params = [cv2.IMWRITE_JPEG_QUALITY, 85]
-        _, jpeg = cv2.imencode('.jpg', annotated_frame, encode_params)
-        
-        return jpeg.tobytes()
+        return [
+            (encode_jpeg(annotated_frame, quality=85), bird_detected)
+            for annotated_frame, bird_detected, _ in detections
+        ]
     
     def get_status(self) -> dict:
         """Get current detection status as dictionary"""
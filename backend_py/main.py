@@ -2,21 +2,54 @@
 AgroVoice Backend - Plant Disease Detection API using YOLOv8
 """
 import os
+import time
+import random
+import asyncio
+import traceback
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Optional
+from typing import Any, Callable, Dict, Optional
 
-from fastapi import FastAPI, HTTPException
+import httpx
+import numpy as np
+from fastapi import FastAPI, HTTPException, Request, Response, UploadFile, File, Form
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 
 from models.yolo_detector import PlantDiseaseDetector
-from utils.image_processing import decode_base64_image, preprocess_image
-from utils.visualization import process_and_visualize
+from utils.image_processing import decode_image_bytes, fit_within, image_size, preprocess_image, encode_jpeg, encode_png, fast_b64decode, fast_b64encode
+from utils.cache import TTLCache, image_digest
+from utils.visualization import draw_disease_regions, overlay_style
 from services.nvidia_tts import NvidiaTTSService
 from services.nvidia_vision import NvidiaVisionService
+from services.batch_queue import AsyncBatchQueue
+from services.knowledge_base import KnowledgeBase
 from bird_server import router as bird_router
-import io
-import base64
+from plant_server import router as plant_router
+
+# HTTP/2 multiplexing for outbound API calls when the h2 package is installed
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# MessagePack responses (raw image bytes instead of base64) for clients that ask for them
+try:
+    import ormsgpack
+    MSGPACK_AVAILABLE = True
+
+    def _msgpack_packb(obj) -> bytes:
+        return ormsgpack.packb(obj, option=ormsgpack.OPT_SERIALIZE_NUMPY | ormsgpack.OPT_NON_STR_KEYS)
+except ImportError:
+    try:
+        import msgpack
+        MSGPACK_AVAILABLE = True
+
+        def _msgpack_packb(obj) -> bytes:
+            return msgpack.packb(obj, use_bin_type=True)
+    except ImportError:
+        MSGPACK_AVAILABLE = False
 
 app = FastAPI(
     title="AgroVoice Disease Detection API",
@@ -36,11 +69,35 @@ app.add_middleware(
 app.include_router(bird_router)
 
 # Include Plant Stream routes
-from plant_server import router as plant_router
 app.include_router(plant_router)
 
 detector: Optional[PlantDiseaseDetector] = None
 nvidia_service: Optional[NvidiaVisionService] = None
+detect_queue: Optional[AsyncBatchQueue] = None
+detect_queue_task: Optional[asyncio.Task] = None
+http_client: Optional[httpx.AsyncClient] = None
+knowledge_base: Optional[KnowledgeBase] = None
+
+# CPU-bound detection gets a narrow pool capped at the physical cores, so it
+# never competes with the default executor's blocking I/O threads
+infer_pool = ThreadPoolExecutor(max_workers=max(1, (os.cpu_count() or 2) // 2), thread_name_prefix="yolo")
+# Drawing + encoding runs here so it never queues behind detection work
+vis_pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 4, thread_name_prefix="vis")
+
+KB_PATH = os.path.join(os.path.dirname(__file__), "../backend/data/agricultural_knowledge.json")
+
+# Content-addressed result caches so re-submitted photos (mobile retries)
+# skip the NVIDIA round-trip and the YOLO pass.
+# Keys: "<image digest>:<language>" for NVIDIA, "<image digest>" for YOLO.
+nvidia_cache = TTLCache(maxsize=512, ttl=3600)
+detection_cache = TTLCache(maxsize=512, ttl=3600)
+
+# Analysis overlays are lossless PNG; OVERLAY_FORMAT=jpeg opts into a JPEG (q80)
+# overlay, whose encode is ~10x cheaper but changes processed_image to image/jpeg
+OVERLAY_JPEG = os.environ.get("OVERLAY_FORMAT", "png").lower() in ("jpeg", "jpg")
+OVERLAY_MIME = "image/jpeg" if OVERLAY_JPEG else "image/png"
+# NVIDIA calls in flight by cache key: concurrent duplicates await one call
+nvidia_inflight: Dict[str, asyncio.Task] = {}
 
 class AnalyzeRequest(BaseModel):
     image: str
@@ -63,25 +120,68 @@ class AnalyzeResponse(BaseModel):
 
 @app.on_event("startup")
 async def startup_event():
-    global detector, nvidia_service, tts_service
+    global detector, nvidia_service, tts_service, detect_queue, detect_queue_task, http_client
     print("🚀 Starting AgroVoice Disease Detection API...")
     
     print("📦 Loading YOLO model...")
     model_path = os.environ.get("MODEL_PATH", None)
     detector = PlantDiseaseDetector(model_path=model_path)
     if detector and detector.model is not None:
+        # Coalesce concurrent /api/analyze requests into one detect_batch call
+        detect_queue = AsyncBatchQueue(detector.detect_batch, max_batch_size=8, max_wait_time=0.02,
+                                       executor=infer_pool)
+        detect_queue_task = asyncio.create_task(detect_queue.process_loop())
+        await asyncio.get_running_loop().run_in_executor(infer_pool, _warmup_detector)
         print(f"✅ YOLO Model loaded successfully (Classes: {len(detector.names)})")
     else:
         print("⚠️ YOLO Model NOT loaded - will use NVIDIA Vision fallback only")
     
     print("🧠 Initializing NVIDIA Vision Service...")
-    nvidia_service = NvidiaVisionService()
+    # One pooled keep-alive client so each analysis skips the TLS handshake.
+    # Analyses arrive minutes apart, so idle connections are kept for 60s
+    # (httpx default: 5s); connect/pool waits fail fast, reads allow for inference.
+    http_client = httpx.AsyncClient(
+        http2=HTTP2_AVAILABLE,
+        limits=httpx.Limits(max_keepalive_connections=32, max_connections=64, keepalive_expiry=60.0),
+        timeout=httpx.Timeout(50.0, connect=5.0, pool=5.0),
+    )
+    nvidia_service = NvidiaVisionService(http_client=http_client)
     
     print("🎤 Initializing NVIDIA TTS Service...")
     tts_service = NvidiaTTSService()
     
+    print("📚 Loading offline knowledge base...")
+    _get_knowledge_base()
+    
     print("✅ Server ready!")
 
+def _warmup_detector():
+    """
+    One dummy pass through detect + overlay encode so OpenCV's thread pool, SIMD
+    dispatch and the JPEG encoder are initialised before the first real request.
+    """
+    start = time.perf_counter()
+    try:
+        dummy = np.zeros((224, 224, 3), dtype=np.uint8)
+        detector.detect(dummy)
+        _render_visualization(dummy, {})
+        print(f"🔥 Detector warm-up done in {(time.perf_counter() - start) * 1000:.0f} ms")
+    except Exception as e:
+        print(f"⚠️ Detector warm-up failed: {e}")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if detect_queue_task is not None:
+        detect_queue_task.cancel()
+        try:
+            await detect_queue_task
+        except asyncio.CancelledError:
+            pass
+    if http_client is not None:
+        await http_client.aclose()
+    infer_pool.shutdown(wait=False)
+    vis_pool.shutdown(wait=False)
+
 @app.get("/")
 async def health_check():
     return {
@@ -103,131 +203,275 @@ async def model_info():
     }
 
 @app.post("/api/analyze", response_model=AnalyzeResponse)
-async def analyze_image(request: AnalyzeRequest):
-    global detector, nvidia_service
-    
+async def analyze_image(request: AnalyzeRequest, http_request: Request):
     if not request.image:
         raise HTTPException(status_code=400, detail="Image is required")
+
+    try:
+        image_bytes = fast_b64decode(request.image)
+    except Exception as e:
+        print(f"❌ [ANALYZE] Decode failed: {e}")
+        raise HTTPException(status_code=400, detail="Invalid image format or data")
+
+    content_type = "image/jpeg"
+    if request.image.startswith("data:"):
+        content_type = request.image[5:].partition(";")[0] or content_type
+    return await _analyze_bytes(image_bytes, request.language, request.mode, image_data=request.image,
+                                content_type=content_type, as_msgpack=_wants_msgpack(http_request))
+
+@app.post("/api/analyze_raw", response_model=AnalyzeResponse)
+async def analyze_image_raw(
+    http_request: Request,
+    image: UploadFile = File(...),
+    cropType: Optional[str] = Form(None),
+    language: str = Form("en"),
+    mode: str = Form("yolo"),
+):
+    """Same as /api/analyze, but takes the image as a multipart file (no base64 round-trip)."""
+    image_bytes = await image.read()
+    if not image_bytes:
+        raise HTTPException(status_code=400, detail="Image is required")
+    return await _analyze_bytes(image_bytes, language, mode, content_type=image.content_type or "image/jpeg",
+                                as_msgpack=_wants_msgpack(http_request))
+
+def _to_data_uri(image_bytes: bytes, content_type: str) -> str:
+    return f"data:{content_type};base64," + fast_b64encode(image_bytes)
+
+def _wants_msgpack(http_request: Request) -> bool:
+    return MSGPACK_AVAILABLE and "application/msgpack" in http_request.headers.get("accept", "")
+
+def _analysis_response(analysis: dict, mode: str, image_bytes: Optional[bytes], content_type: str,
+                       image_data: Optional[str] = None, as_msgpack: bool = False):
+    """
+    Build the analyze response. JSON clients get `processed_image` as a data URI
+    (`image_data` is reused when it already is one); clients sending
+    `Accept: application/msgpack` get the raw image bytes with no base64 at all.
+    """
+    timestamp = datetime.now().isoformat()
+    if as_msgpack:
+        body = _msgpack_packb({
+            "success": True,
+            "analysis": analysis,
+            "processed_image": image_bytes,
+            "processed_image_type": content_type,
+            "timestamp": timestamp,
+            "mode": mode,
+        })
+        return Response(content=body, media_type="application/msgpack")
+    if image_bytes is not None and not (image_data and image_data.startswith("data:")):
+        image_data = _to_data_uri(image_bytes, content_type)
+    return AnalyzeResponse(
+        success=True,
+        analysis=analysis,
+        processed_image=image_data,
+        timestamp=timestamp,
+        mode=mode
+    )
+
+async def _analyze_bytes(image_bytes: bytes, language: Optional[str], mode: Optional[str],
+                         image_data: Optional[str] = None, content_type: str = "image/jpeg",
+                         as_msgpack: bool = False):
+    """
+    Shared analysis pipeline for the JSON and multipart endpoints.
+    `image_data` is the original base64/data-URI payload when the client sent one;
+    otherwise a data URI is built from `image_bytes` only if it has to be echoed back.
+    """
+    global detector, nvidia_service
     
     try:
-        print(f"📸 [ANALYZE] Processing request (Mode: {request.mode})...")
+        print(f"📸 [ANALYZE] Processing request (Mode: {mode})...")
+
+        image_key = image_digest(image_bytes)
+        nvidia_key = f"{image_key}:{language}"
         
         # Scenario A: NVIDIA Mode
-        if request.mode == "nvidia":
+        if mode == "nvidia":
             if not nvidia_service:
                 raise HTTPException(status_code=503, detail="NVIDIA service not initialized")
             
-            # Add explicit timeout for the API call wrapper (just in case)
-            import asyncio
+            # Add explicit timeout for the API call wrapper (just in case).
+            # Send the client's base64 as-is, or the raw upload bytes (encoded once by the service);
+            # oversized photos are shrunk to the VLM resolution first
             try:
-                result = await asyncio.wait_for(nvidia_service.analyze_image(request.image, request.language), timeout=50.0)
+                result = await _cached_nvidia_analysis(nvidia_key, image_bytes, language, timeout=50.0,
+                                                       prepare=lambda raw: _vlm_upload(raw, image_data))
             except asyncio.TimeoutError:
                 raise HTTPException(status_code=504, detail="NVIDIA Analysis timed out")
             
             if not result["success"]:
                  raise HTTPException(status_code=500, detail=result["error"])
             
-            return AnalyzeResponse(
-                success=True,
-                analysis=result["analysis"],
-                processed_image=request.image, # Return original for now as NVIDIA doesn't draw boxes
-                timestamp=datetime.now().isoformat(),
-                mode="nvidia"
-            )
+            # Return original for now as NVIDIA doesn't draw boxes
+            return _analysis_response(result["analysis"], "nvidia", image_bytes, content_type,
+                                      image_data=image_data, as_msgpack=as_msgpack)
 
         # Scenario B: YOLO Mode (Default)
         if detector is None:
             raise HTTPException(status_code=503, detail="YOLO Model not loaded")
 
-        # 1. Decode & Preprocess
+        # 1. Decode & Preprocess (one BGR buffer shared by the model input and the display image)
         try:
-            original_image = decode_base64_image(request.image)
+            # Nothing downstream needs more than the 1024px VLM payload
+            original_image = decode_image_bytes(image_bytes, min_side=1024)
         except Exception as e:
             print(f"❌ [ANALYZE] Decode failed: {e}")
             raise HTTPException(status_code=400, detail="Invalid image format or data")
+        # Ensure manageable size for display
+        display_image = fit_within(original_image, 800)
 
-        model_input = preprocess_image(original_image, target_size=(224, 224))
-        
         # 2. Run Model (Offload to thread pool to prevent blocking event loop)
-        print("🤖 [ANALYZE] Running YOLO inference...")
-        import asyncio
-        loop = asyncio.get_event_loop()
-        # Run synchronous YOLO detect in a separate thread
-        result = await loop.run_in_executor(None, detector.detect, model_input)
+        cached = detection_cache.get(image_key)
+        if cached is not None:
+            print("⚡ [ANALYZE] YOLO cache hit")
+            # Shallow copy: the NVIDIA merge below replaces keys on this dict
+            result = dict(cached)
+        else:
+            model_input = preprocess_image(display_image, target_size=(224, 224))
+            print("🤖 [ANALYZE] Running YOLO inference...")
+            if detect_queue is not None:
+                # Batched with other in-flight requests; runs in a worker thread
+                result = await detect_queue.add_request(model_input)
+            else:
+                result = await asyncio.get_running_loop().run_in_executor(infer_pool, detector.detect, model_input)
+            if result is not None:
+                detection_cache.set(image_key, dict(result))
         
-        # 3. Enhance with NVIDIA AI (if available) for much better naming
+        # 3 + 4. NVIDIA enhancement and visualization run concurrently: the drawing
+        # only needs the local detection, so its cost hides inside the VLM round-trip
+        # (redrawn below in the rare case the merge changes the overlay colours)
+        loop = asyncio.get_running_loop()
+        nv_task = None
         if nvidia_service and nvidia_service.client:
-            try:
-                print("🧠 [ANALYZE] Enhancing with NVIDIA Specialist Insight...")
-                # Request a quick analysis from NVIDIA to get the real names
-                # Add a shorter timeout for enhancement - if it takes too long, just use YOLO
+            print("🧠 [ANALYZE] Enhancing with NVIDIA Specialist Insight...")
+            nv_task = _fetch_nvidia_enhancement(original_image, language, nvidia_key)
+        print("🎨 [ANALYZE] Drawing disease regions...")
+        drawn_style = overlay_style(result) if result is not None else None
+        vis_task = loop.run_in_executor(vis_pool, _render_visualization, display_image, result)
+        
+        if nv_task is not None:
+            nv_result, processed_overlay = await asyncio.gather(nv_task, vis_task)
+            if nv_result is not None:
                 try:
-                    nv_result = await asyncio.wait_for(nvidia_service.analyze_image(request.image, request.language), timeout=15.0)
-                    if nv_result["success"]:
-                        nv_analysis = nv_result["analysis"]
-                        # Merge NVIDIA's accurate names and descriptions into the result
-                        result["disease_name"] = nv_analysis.get("disease_name", result["disease_name"])
-                        result["disease_name_hindi"] = nv_analysis.get(f"disease_name_{request.language}", nv_analysis.get("disease_name_localized", result["disease_name_hindi"]))
-                        result["crop_identified"] = nv_analysis.get("crop_identified", result["crop_identified"])
-                        result["description"] = nv_analysis.get("description", result["description"])
-                        result["description_hindi"] = nv_analysis.get(f"description_{request.language}", nv_analysis.get("description_localized", result["description_hindi"]))
-                        result["symptoms"] = nv_analysis.get("symptoms", result["symptoms"])
-                        result["treatment_steps"] = nv_analysis.get("treatment_steps", result["treatment_steps"])
-                        result["organic_options"] = nv_analysis.get("organic_options", result["organic_options"])
-                        result["prevention_tips"] = nv_analysis.get("prevention_tips", result["prevention_tips"])
-                        # Use NVIDIA's confidence if it's high
-                        if nv_analysis.get("confidence"):
-                            result["confidence"] = nv_analysis["confidence"]
-                        # SYNC HEALTH STATUS
-                        if "is_healthy" in nv_analysis:
-                            result["is_healthy"] = nv_analysis["is_healthy"]
-                        if "severity" in nv_analysis:
-                            result["severity"] = nv_analysis["severity"]
-                    else:
-                        print(f"⚠️ [ANALYZE] NVIDIA enhancement returned error: {nv_result.get('error')}")
-                except asyncio.TimeoutError:
-                    print("⚠️ [ANALYZE] NVIDIA enhancement timed out - Proceeding with YOLO result only")
-            except Exception as nve:
-                print(f"⚠️ [ANALYZE] NVIDIA enhancement failed: {nve}")
-
-        # 4. Generate Visualizations (Softly fail if this parts crashes)
-        processed_image_b64 = None
-        try:
-            print("🎨 [ANALYZE] Drawing disease regions...")
-            display_image = original_image.copy()
-            # Ensure manageable size for display
-            if display_image.width > 800 or display_image.height > 800:
-                display_image.thumbnail((800, 800))
-            
-            # Use new visualization with precise disease regions    
-            _, processed_b64 = process_and_visualize(display_image, result)
-            processed_image_b64 = "data:image/png;base64," + processed_b64
-        except Exception as ve:
-            print(f"⚠️ [ANALYZE] Visualization failed (soft fail): {ve}")
-            # Fallback to original image if visualization failed
-            try:
-                buffered = io.BytesIO()
-                original_image.save(buffered, format="JPEG")
-                processed_image_b64 = "data:image/jpeg;base64," + base64.b64encode(buffered.getvalue()).decode()
-            except:
-                pass
+                    _merge_nvidia_analysis(result, nv_result["analysis"], language)
+                except Exception as nve:
+                    print(f"⚠️ [ANALYZE] NVIDIA enhancement failed: {nve}")
+                if result is not None and overlay_style(result) != drawn_style:
+                    # NVIDIA changed the health verdict: keep the image in line with the text
+                    processed_overlay = await loop.run_in_executor(vis_pool, _render_visualization,
+                                                                   display_image, result)
+        else:
+            processed_overlay = await vis_task
         
-        return AnalyzeResponse(
-            success=True,
-            analysis=result,
-            processed_image=processed_image_b64,
-            timestamp=datetime.now().isoformat(),
-            mode="yolo"
-        )
+        if processed_overlay is not None:
+            return _analysis_response(result, "yolo", processed_overlay, OVERLAY_MIME, as_msgpack=as_msgpack)
+        # Fallback to original image if visualization failed: the client's own
+        # payload is already a valid image, so hand it back instead of re-encoding
+        return _analysis_response(result, "yolo", image_bytes, content_type,
+                                  image_data=image_data, as_msgpack=as_msgpack)
 
     except HTTPException:
         raise
     except Exception as e:
         print(f"❌ [ANALYZE] Error: {e}")
-        import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
 
+def _vlm_payload(image) -> bytes:
+    """JPEG for the VLM: capped at 1024px (it gains nothing from more), encoded from the decoded buffer."""
+    return encode_jpeg(fit_within(image, 1024), quality=85)
+
+def _vlm_upload(image_bytes: bytes, image_data: Optional[str] = None):
+    """
+    NVIDIA-mode payload: the client's image unchanged (its base64 if it sent one)
+    when it already fits 1024px, otherwise a 1024px re-encode so full-size phone
+    photos are not uploaded (as base64, +33%) at resolution the VLM discards.
+    """
+    size = image_size(image_bytes)
+    if size is None or max(size) <= 1024:
+        return image_data or image_bytes
+    return _vlm_payload(decode_image_bytes(image_bytes, min_side=1024))
+
+async def _fetch_nvidia_enhancement(image, language: Optional[str], nvidia_key: str) -> Optional[dict]:
+    """Quick NVIDIA analysis used to enhance a YOLO result; None if unavailable, failed or slow."""
+    try:
+        # Request a quick analysis from NVIDIA to get the real names
+        # Add a shorter timeout for enhancement - if it takes too long, just use YOLO
+        nv_result = await _cached_nvidia_analysis(nvidia_key, image, language, timeout=15.0,
+                                                  prepare=_vlm_payload)
+        if nv_result["success"]:
+            return nv_result
+        print(f"⚠️ [ANALYZE] NVIDIA enhancement returned error: {nv_result.get('error')}")
+    except asyncio.TimeoutError:
+        print("⚠️ [ANALYZE] NVIDIA enhancement timed out - Proceeding with YOLO result only")
+    except Exception as nve:
+        print(f"⚠️ [ANALYZE] NVIDIA enhancement failed: {nve}")
+    return None
+
+async def _cached_nvidia_analysis(nvidia_key: str, image: Any, language: Optional[str], timeout: float,
+                                  prepare: Optional[Callable[[Any], Any]] = None) -> dict:
+    """
+    NVIDIA analysis through nvidia_cache, with concurrent requests for the same
+    key sharing one in-flight call. `prepare` (run on vis_pool) turns `image`
+    into the payload. A caller that times out stops waiting, but the shared call
+    finishes so its result still reaches the cache and any other waiters.
+    """
+    result = nvidia_cache.get(nvidia_key)
+    if result is not None:
+        print("⚡ [ANALYZE] NVIDIA cache hit")
+        return result
+    task = nvidia_inflight.get(nvidia_key)
+    if task is None:
+        task = asyncio.create_task(_run_nvidia_analysis(nvidia_key, image, language, prepare))
+        nvidia_inflight[nvidia_key] = task
+    else:
+        print("⏳ [ANALYZE] Joining in-flight NVIDIA analysis")
+    return await asyncio.wait_for(asyncio.shield(task), timeout=timeout)
+
+async def _run_nvidia_analysis(nvidia_key: str, image: Any, language: Optional[str],
+                               prepare: Optional[Callable[[Any], Any]]) -> dict:
+    try:
+        payload = image
+        if prepare is not None:
+            payload = await asyncio.get_running_loop().run_in_executor(vis_pool, prepare, image)
+        result = await nvidia_service.analyze_image(payload, language)
+        if result["success"]:
+            nvidia_cache.set(nvidia_key, result)
+        return result
+    finally:
+        nvidia_inflight.pop(nvidia_key, None)
+
+def _merge_nvidia_analysis(result: dict, nv_analysis: dict, language: Optional[str]):
+    """Merge NVIDIA's accurate names and descriptions into the YOLO result (in place)."""
+    result["disease_name"] = nv_analysis.get("disease_name", result["disease_name"])
+    result["disease_name_hindi"] = nv_analysis.get(f"disease_name_{language}", nv_analysis.get("disease_name_localized", result["disease_name_hindi"]))
+    result["crop_identified"] = nv_analysis.get("crop_identified", result["crop_identified"])
+    result["description"] = nv_analysis.get("description", result["description"])
+    result["description_hindi"] = nv_analysis.get(f"description_{language}", nv_analysis.get("description_localized", result["description_hindi"]))
+    result["symptoms"] = nv_analysis.get("symptoms", result["symptoms"])
+    result["treatment_steps"] = nv_analysis.get("treatment_steps", result["treatment_steps"])
+    result["organic_options"] = nv_analysis.get("organic_options", result["organic_options"])
+    result["prevention_tips"] = nv_analysis.get("prevention_tips", result["prevention_tips"])
+    # Use NVIDIA's confidence if it's high
+    if nv_analysis.get("confidence"):
+        result["confidence"] = nv_analysis["confidence"]
+    # SYNC HEALTH STATUS
+    if "is_healthy" in nv_analysis:
+        result["is_healthy"] = nv_analysis["is_healthy"]
+    if "severity" in nv_analysis:
+        result["severity"] = nv_analysis["severity"]
+
+def _render_visualization(display_image, result: dict) -> Optional[bytes]:
+    """Draw disease regions and return the overlay as OVERLAY_MIME bytes (worker thread; soft-fails to None)."""
+    try:
+        # Use new visualization with precise disease regions
+        overlay = draw_disease_regions(display_image, result)
+        if OVERLAY_JPEG:
+            return encode_jpeg(overlay, quality=80)
+        return encode_png(overlay)
+    except Exception as ve:
+        print(f"⚠️ [ANALYZE] Visualization failed (soft fail): {ve}")
+        return None
+
 @app.post("/api/tts")
 async def generate_speech(request: TTSRequest):
     global tts_service
@@ -244,7 +488,7 @@ async def generate_speech(request: TTSRequest):
              raise HTTPException(status_code=500, detail="TTS generation failed")
              
         # Convert to base64
-        audio_base64 = base64.b64encode(audio_bytes).decode('utf-8')
+        audio_base64 = fast_b64encode(audio_bytes)
         return {
             "success": True,
             "audio": audio_base64,
@@ -254,6 +498,35 @@ async def generate_speech(request: TTSRequest):
         print(f"❌ [TTS] Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Conversational intros, formatted only once a match has been found
+_INTROS = {
+    "en": (
+        "Regarding {t}, here is some advice. ",
+        "For {t}, I've learned that ",
+        "Ah, {t}! Here is a quick rundown."
+    ),
+    "hi": (
+        "{t} के लिए, यहाँ मेरी सलाह है। ",
+        "हाँ, {t} को लेकर अक्सर पूछा जाता है। देखिए... ",
+        "तो आप {t} के बारे में जानना चाहते हैं? मैं बताता हूँ..."
+    )
+}
+
+def _make_conversational(content: str, topic_name: str, lang: str) -> str:
+    intros = _INTROS.get(lang, _INTROS["en"])
+    prefix = intros[random.randrange(len(intros))].format(t=topic_name)
+    return f"{prefix} {content}"
+
+def _get_knowledge_base() -> Optional[KnowledgeBase]:
+    """Load the offline KB on first use; a missing file is retried on the next call."""
+    global knowledge_base
+    if knowledge_base is None:
+        try:
+            knowledge_base = KnowledgeBase.load(KB_PATH)
+        except Exception as e:
+            print(f"⚠️ [CHAT] Knowledge base unavailable: {e}")
+    return knowledge_base
+
 @app.post("/api/chat_offline")
 async def chat_offline(request: dict):
     """
@@ -262,69 +535,39 @@ async def chat_offline(request: dict):
     text = request.get("text", "").lower()
     lang = request.get("language", "en")
     
-    # Load knowledge base locally in Python for speed
-    import json
-    import random
-    kb_path = os.path.join(os.path.dirname(__file__), "../backend/data/agricultural_knowledge.json")
-    try:
-        with open(kb_path, 'r', encoding='utf-8') as f:
-            kb = json.load(f)
-    except:
-        return {"success": False, "error": "Knowledge base not found: " + kb_path}
-
-    def make_conversational(content, topic_name):
-        intros = {
-            "en": [
-                f"Regarding {topic_name}, here is some advice. ",
-                f"For {topic_name}, I've learned that ",
-                f"Ah, {topic_name}! Here is a quick rundown."
-            ],
-            "hi": [
-                f"{topic_name} के लिए, यहाँ मेरी सलाह है। ",
-                f"हाँ, {topic_name} को लेकर अक्सर पूछा जाता है। देखिए... ",
-                f"तो आप {topic_name} के बारे में जानना चाहते हैं? मैं बताता हूँ..."
-            ]
-        }
-        prefix = random.choice(intros.get(lang, intros["en"]))
-        return f"{prefix} {content}"
+    # Knowledge base is parsed and indexed once, then kept in memory
+    kb = _get_knowledge_base()
+    if kb is None:
+        return {"success": False, "error": "Knowledge base not found: " + KB_PATH}
 
     # Simple Keyword-based Intelligence
-    response_parts = []
-    
     # Check crops
-    detected_crop = None
-    for crop_key, crop_data in kb.get("crops", {}).items():
-        if any(name in text for name in crop_data.get("names", [])) or crop_key in text:
-            detected_crop = (crop_key, crop_data)
-            break
-    
-    if detected_crop:
-        key, data = detected_crop
-        topic = "care"
-        for t_key, keywords in kb.get("topics", {}).items():
-            if any(kw in text for kw in keywords):
-                topic = t_key
-                break
+    crop_key = kb.crop_index.first_match(text)
+    if crop_key:
+        key, data = crop_key, kb.crops[crop_key]
+        topic = kb.topic_index.first_match(text) or "care"
         
         advice = data.get(topic, {}).get(lang) or data.get("care", {}).get(lang) or data.get(topic, {}).get("en")
         if advice:
-            return {"success": True, "text": make_conversational(advice, key.capitalize()), "source": "local_wisdom"}
+            return {"success": True, "text": _make_conversational(advice, key.capitalize(), lang), "source": "local_wisdom"}
 
     # Check Diseases
-    for d_key, d_data in kb.get("disease_reference", {}).items():
-        if d_key.replace("_", " ") in text:
-            symp = d_data.get("symptoms", {}).get(lang) or d_data.get("symptoms", {}).get("en")
-            treat = d_data.get("treatment", {}).get(lang) or d_data.get("treatment", {}).get("en")
-            content = f"{symp}\n\n**Here's the plan:** {treat}"
-            return {"success": True, "text": make_conversational(content, d_key.replace('_', ' ').capitalize()), "source": "local_wisdom"}
+    d_key = kb.disease_index.first_match(text)
+    if d_key:
+        d_data = kb.diseases[d_key]
+        symp = d_data.get("symptoms", {}).get(lang) or d_data.get("symptoms", {}).get("en")
+        treat = d_data.get("treatment", {}).get(lang) or d_data.get("treatment", {}).get("en")
+        content = f"{symp}\n\n**Here's the plan:** {treat}"
+        return {"success": True, "text": _make_conversational(content, d_key.replace('_', ' ').capitalize(), lang), "source": "local_wisdom"}
 
     # Check Pests
-    for p_key, p_data in kb.get("pest_reference", {}).items():
-        if p_key.replace("_", " ") in text:
-            symp = p_data.get("symptoms", {}).get(lang) or p_data.get("symptoms", {}).get("en")
-            ctrl = p_data.get("control", {}).get(lang) or p_data.get("control", {}).get("en")
-            content = f"{symp}\n\n**What you should do:** {ctrl}"
-            return {"success": True, "text": make_conversational(content, p_key.replace('_', ' ').capitalize()), "source": "local_wisdom"}
+    p_key = kb.pest_index.first_match(text)
+    if p_key:
+        p_data = kb.pests[p_key]
+        symp = p_data.get("symptoms", {}).get(lang) or p_data.get("symptoms", {}).get("en")
+        ctrl = p_data.get("control", {}).get(lang) or p_data.get("control", {}).get("en")
+        content = f"{symp}\n\n**What you should do:** {ctrl}"
+        return {"success": True, "text": _make_conversational(content, p_key.replace('_', ' ').capitalize(), lang), "source": "local_wisdom"}
 
     return {
         "success": False,
@@ -0,0 +1,53 @@
+"""
+Fused per-pixel colour classification for PlantDiseaseDetector (Numba).
+"""
+import numpy as np
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+
+def classify_hsv(hsv, gray, disease_mask, low, high, dark_max):
+    """
+    Count green, yellow, brown and dark pixels in one pass over an HSV image and
+    its grayscale twin, writing the brown-or-dark disease mask (0/255) as it goes.
+
+    `low`/`high` are (3, 3) uint8 rows of inclusive HSV bounds for green, yellow
+    and brown (cv2.inRange semantics); dark means gray <= dark_max
+    (cv2.threshold THRESH_BINARY_INV). All arrays must be C-contiguous.
+    """
+    # Flat uint8 loop with branchless tests and int32 counters so LLVM vectorises it
+    pixels = hsv.reshape(-1)
+    gray = gray.reshape(-1)
+    mask = disease_mask.reshape(-1)
+    gl0, gl1, gl2 = low[0, 0], low[0, 1], low[0, 2]
+    gh0, gh1, gh2 = high[0, 0], high[0, 1], high[0, 2]
+    yl0, yl1, yl2 = low[1, 0], low[1, 1], low[1, 2]
+    yh0, yh1, yh2 = high[1, 0], high[1, 1], high[1, 2]
+    bl0, bl1, bl2 = low[2, 0], low[2, 1], low[2, 2]
+    bh0, bh1, bh2 = high[2, 0], high[2, 1], high[2, 2]
+    dark_max = np.uint8(dark_max)
+
+    green = yellow = brown = dark = np.int32(0)
+    for p in range(gray.shape[0]):
+        h, s, v = pixels[3 * p], pixels[3 * p + 1], pixels[3 * p + 2]
+        is_green = (h >= gl0) & (h <= gh0) & (s >= gl1) & (s <= gh1) & (v >= gl2) & (v <= gh2)
+        is_yellow = (h >= yl0) & (h <= yh0) & (s >= yl1) & (s <= yh1) & (v >= yl2) & (v <= yh2)
+        is_brown = (h >= bl0) & (h <= bh0) & (s >= bl1) & (s <= bh1) & (v >= bl2) & (v <= bh2)
+        is_dark = gray[p] <= dark_max
+        green += np.int32(is_green)
+        yellow += np.int32(is_yellow)
+        brown += np.int32(is_brown)
+        dark += np.int32(is_dark)
+        mask[p] = np.uint8(255) if (is_brown | is_dark) else np.uint8(0)
+    return int(green), int(yellow), int(brown), int(dark)
+
+
+if NUMBA_AVAILABLE:
+    # nogil rather than parallel=True: detect_batch already runs several
+    # detect() calls at once, and Numba's default threading layer does not
+    # allow concurrent parallel launches from multiple threads
+    classify_hsv = njit(nogil=True, cache=True)(classify_hsv)
@@ -3,8 +3,12 @@ Plant Disease Detector - Color-Based Detection for Lemons and Leaves.
 Simplified, reliable detection using OpenCV color analysis.
 Detects: Lemon (Healthy/Spoiled), Leaf (Good/Bad)
 """
+import os
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Dict, List, Optional, Union
 from PIL import Image
 import numpy as np
 
@@ -13,6 +17,21 @@ try:
 except ImportError:
     cv2 = None
 
+from ._color_kernels import NUMBA_AVAILABLE, classify_hsv
+
+# HSV ranges (OpenCV scale: H 0-180, S/V 0-255), built once at import
+_LOW_GREEN = np.array([35, 40, 40], dtype=np.uint8)
+_HIGH_GREEN = np.array([85, 255, 255], dtype=np.uint8)
+_LOW_YELLOW = np.array([15, 40, 40], dtype=np.uint8)
+_HIGH_YELLOW = np.array([40, 255, 255], dtype=np.uint8)
+_LOW_BROWN = np.array([5, 30, 20], dtype=np.uint8)
+_HIGH_BROWN = np.array([20, 180, 150], dtype=np.uint8)
+_DARK_MAX = 40  # gray level at or below which a pixel counts as a dark spot
+
+# Green/yellow/brown bounds stacked for the fused Numba kernel
+_LOW_BOUNDS = np.stack([_LOW_GREEN, _LOW_YELLOW, _LOW_BROWN])
+_HIGH_BOUNDS = np.stack([_HIGH_GREEN, _HIGH_YELLOW, _HIGH_BROWN])
+
 
 class PlantDiseaseDetector:
     """
@@ -22,80 +41,128 @@ class PlantDiseaseDetector:
     - Brown/dark spots = Spoiled/Bad
     """
     
-    def __init__(self, model_path: str = None):
+    # Longest side the colour analysis runs at (larger inputs are downscaled)
+    ANALYSIS_MAX_SIDE = 512
+    
+    # Parsed disease_info.json by path, shared across instances
+    _DISEASE_INFO_CACHE: Dict[str, dict] = {}
+    
+    # Worker threads for detect_batch, created on first use
+    _BATCH_POOL: Optional[ThreadPoolExecutor] = None
+    _BATCH_POOL_LOCK = threading.Lock()
+    
+    # Per-thread mask buffers reused across detect() calls (detect_batch runs
+    # detect concurrently, so each worker thread needs its own set)
+    _SCRATCH = threading.local()
+    
+    def __init__(self, model_path: str = None, analysis_max_side: Optional[int] = None):
         self.model_path = model_path
+        if analysis_max_side is not None:
+            self.ANALYSIS_MAX_SIDE = analysis_max_side
         self.model = True  # Backward compatibility
         self.disease_info = self._load_disease_info()
         print("🌱 PlantDiseaseDetector initialized (Color-based mode)")
     
-    def _load_disease_info(self) -> dict:
-        data_path = Path(__file__).parent.parent / "data" / "disease_info.json"
+    @classmethod
+    def _load_disease_info(cls) -> dict:
+        """Parse disease_info.json once per process; every detector instance shares it (read-only)."""
+        data_path = str(Path(__file__).parent.parent / "data" / "disease_info.json")
+        cached = cls._DISEASE_INFO_CACHE.get(data_path)
+        if cached is not None:
+            return cached
         try:
             with open(data_path, "r", encoding="utf-8") as f:
-                return json.load(f)
+                info = json.load(f)
         except:
             return {}
+        cls._DISEASE_INFO_CACHE[data_path] = info
+        return info
 
-    def detect(self, image: Image.Image) -> dict:
+    def detect(self, image: Union[Image.Image, np.ndarray]) -> dict:
         """
         Main detection method. Analyzes colors to identify Leaf or Lemon.
+        Accepts a PIL image or a BGR uint8 array (used as-is, no copy).
         Returns dict with detection info, or None if nothing detected.
         """
         if cv2 is None:
             return None
             
-        # Convert PIL to OpenCV
-        img_np = np.array(image.convert("RGB"))
-        img_bgr = cv2.cvtColor(img_np, cv2.COLOR_RGB2BGR)
-        height, width = img_bgr.shape[:2]
+        if isinstance(image, np.ndarray):
+            img = image
+            to_hsv, to_gray = cv2.COLOR_BGR2HSV, cv2.COLOR_BGR2GRAY
+        else:
+            # PIL pixels are RGB: convert from RGB directly, no BGR copy
+            img = np.asarray(image.convert("RGB"))
+            to_hsv, to_gray = cv2.COLOR_RGB2HSV, cv2.COLOR_RGB2GRAY
+        
+        # Ratios are scale-invariant, so analyse at most ANALYSIS_MAX_SIDE px
+        # and map region boxes back to input coordinates at the end
+        scale = self.ANALYSIS_MAX_SIDE / max(img.shape[:2])
+        if scale < 1:
+            img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        else:
+            scale = 1.0
+        height, width = img.shape[:2]
         total_pixels = width * height
         
         # Convert to HSV for color analysis
-        hsv = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2HSV)
+        buf = self._scratch_buffers(height, width)
+        hsv = cv2.cvtColor(img, to_hsv, dst=buf["hsv"])
         
         # ========== COLOR DETECTION ==========
         
-        # GREEN (Leaves): Hue 35-85, decent saturation and value
-        green_mask = cv2.inRange(hsv, np.array([35, 40, 40]), np.array([85, 255, 255]))
-        green_pixels = np.sum(green_mask > 0)
-        green_ratio = green_pixels / total_pixels
-        
-        # YELLOW (Lemons): Hue 15-40, flexible saturation
-        yellow_mask = cv2.inRange(hsv, np.array([15, 40, 40]), np.array([40, 255, 255]))
-        yellow_pixels = np.sum(yellow_mask > 0)
-        yellow_ratio = yellow_pixels / total_pixels
-        
-        # BROWN (Spoilage): Hue 5-20, medium saturation, lower value
-        brown_mask = cv2.inRange(hsv, np.array([5, 30, 20]), np.array([20, 180, 150]))
-        brown_pixels = np.sum(brown_mask > 0)
-        brown_ratio = brown_pixels / total_pixels
+        if NUMBA_AVAILABLE:
+            # One fused pass: all four colour counts plus the disease mask
+            gray = cv2.cvtColor(img, to_gray, dst=buf["gray"])
+            green_pixels, yellow_pixels, brown_pixels, dark_pixels = classify_hsv(
+                hsv, gray, buf["disease"], _LOW_BOUNDS, _HIGH_BOUNDS, _DARK_MAX
+            )
+        else:
+            # GREEN (Leaves): Hue 35-85, decent saturation and value
+            green_mask = cv2.inRange(hsv, _LOW_GREEN, _HIGH_GREEN, dst=buf["green"])
+            green_pixels = cv2.countNonZero(green_mask)
+            
+            # YELLOW (Lemons): Hue 15-40, flexible saturation
+            yellow_mask = cv2.inRange(hsv, _LOW_YELLOW, _HIGH_YELLOW, dst=buf["yellow"])
+            yellow_pixels = cv2.countNonZero(yellow_mask)
+            brown_pixels = dark_pixels = None
         
-        # DARK SPOTS (Rot): Very low brightness
-        gray = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
-        _, dark_mask = cv2.threshold(gray, 40, 255, cv2.THRESH_BINARY_INV)
-        dark_ratio = np.sum(dark_mask > 0) / total_pixels
         
         # ========== DETECTION LOGIC ==========
         
         # Minimum threshold: at least 1% of frame should have the color
-        MIN_THRESHOLD = 0.01
-        
-        category = None
-        confidence = 0.0
+        # (integer form: count > total // 100 is exactly ratio > 0.01)
+        min_pixels = total_pixels // 100
         
         # Priority 1: Detect LEAF if significant green
-        if green_ratio > MIN_THRESHOLD:
-            category = "Leaf"
-            confidence = min(95, 30 + green_ratio * 200)
-            
         # Priority 2: Detect LEMON if significant yellow (and not mostly green)
-        if yellow_ratio > MIN_THRESHOLD and yellow_ratio > green_ratio:
-            category = "Lemon"
-            confidence = min(95, 30 + yellow_ratio * 200)
+        if yellow_pixels > min_pixels and yellow_pixels > green_pixels:
+            category, category_pixels = "Lemon", yellow_pixels
+        elif green_pixels > min_pixels:
+            category, category_pixels = "Leaf", green_pixels
+        else:
+            # If nothing detected, return None
+            return None  # brown/dark passes below are skipped
         
-        # If nothing detected, return None
-        if category is None:
-            return None
+        green_ratio = green_pixels / total_pixels
+        yellow_ratio = yellow_pixels / total_pixels
+        confidence = min(95, 30 + category_pixels * 200 / total_pixels)
+        
+        # ========== DAMAGE COLORS (only computed once something is found) ==========
+        
+        if brown_pixels is None:
+            # BROWN (Spoilage): Hue 5-20, medium saturation, lower value
+            brown_mask = cv2.inRange(hsv, _LOW_BROWN, _HIGH_BROWN, dst=buf["brown"])
+            brown_pixels = cv2.countNonZero(brown_mask)
+            
+            # DARK SPOTS (Rot): Very low brightness
+            gray = cv2.cvtColor(img, to_gray, dst=buf["gray"])
+            _, dark_mask = cv2.threshold(gray, _DARK_MAX, 255, cv2.THRESH_BINARY_INV, dst=buf["dark"])
+            dark_pixels = cv2.countNonZero(dark_mask)
+            cv2.bitwise_or(brown_mask, dark_mask, dst=buf["disease"])
+        
+        brown_ratio = brown_pixels / total_pixels
+        dark_ratio = dark_pixels / total_pixels
         
         # ========== HEALTH ANALYSIS ==========
         
@@ -124,13 +191,19 @@ class PlantDiseaseDetector:
         
         # ========== FIND DISEASE REGIONS ==========
         
-        disease_mask = cv2.bitwise_or(brown_mask, dark_mask)
-        contours, _ = cv2.findContours(disease_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        regions = []
-        for cnt in contours:
-            if cv2.contourArea(cnt) > (total_pixels * 0.003):  # 0.3% minimum
-                x, y, w, h = cv2.boundingRect(cnt)
-                regions.append({"x": x, "y": y, "w": w, "h": h})
+        disease_mask = buf["disease"]
+        min_area = total_pixels * 0.003  # 0.3% minimum
+        box_scale = 1.0 / scale
+        
+        # One labelling pass yields every component's box; only components
+        # whose box can hold min_area get their outline traced, so speckled
+        # masks no longer cost a Python iteration per contour
+        _, labels, stats, _ = cv2.connectedComponentsWithStats(disease_mask, connectivity=8)
+        outlines = self._region_outlines(labels, stats, min_area)
+        boxes = stats[list(outlines), :4]
+        if box_scale != 1.0:
+            boxes = np.rint(boxes * box_scale).astype(np.int64)
+        regions = [{"x": x, "y": y, "w": w, "h": h} for x, y, w, h in boxes.tolist()]
         
         return {
             "disease_name": disease_name,
@@ -148,3 +221,80 @@ class PlantDiseaseDetector:
             },
             "disease_regions": regions
         }
+
+    def detect_batch(self, images: List[Union[Image.Image, np.ndarray]]) -> List[Optional[dict]]:
+        """
+        Batch entry point for the request-coalescing queue. Detection is
+        per-image color analysis (no network forward pass to stack); the
+        OpenCV calls release the GIL, so images are analysed concurrently
+        on a small shared pool.
+        """
+        if len(images) <= 1:
+            return [self.detect(image) for image in images]
+        return list(self._get_batch_pool().map(self.detect, images))
+    
+    @classmethod
+    def _scratch_buffers(cls, height: int, width: int) -> Dict[str, np.ndarray]:
+        """This thread's HSV/mask buffers for an analysis size, reallocated only when the size changes."""
+        buffers = getattr(cls._SCRATCH, "buffers", None)
+        if buffers is None or buffers["gray"].shape != (height, width):
+            buffers = {name: np.empty((height, width), np.uint8)
+                       for name in ("green", "yellow", "brown", "gray", "dark", "disease")}
+            buffers["hsv"] = np.empty((height, width, 3), np.uint8)
+            cls._SCRATCH.buffers = buffers
+        return buffers
+    
+    @staticmethod
+    def _region_outlines(labels: np.ndarray, stats: np.ndarray, min_area: float) -> Dict[int, np.ndarray]:
+        """
+        Outer contours of the labelled components that count as disease regions.
+        
+        Keeps the findContours(RETR_EXTERNAL) + contourArea rule: a region's
+        area is that of its outline (holes included), and components lying
+        inside another region's hole are not reported. Regions come back in
+        findContours order, so the overlay's #N labels are unchanged.
+        """
+        # A contour through pixel centres encloses at most (w - 1) * (h - 1)
+        spans = (stats[:, cv2.CC_STAT_WIDTH] - 1) * (stats[:, cv2.CC_STAT_HEIGHT] - 1)
+        spans[0] = 0  # row 0 is the background
+        outlines = {}
+        for label in np.flatnonzero(spans > min_area).tolist():
+            x, y, w, h = stats[label, :4].tolist()
+            component = (labels[y:y + h, x:x + w] == label).view(np.uint8)
+            contours, _ = cv2.findContours(component, cv2.RETR_EXTERNAL,
+                                           cv2.CHAIN_APPROX_SIMPLE, offset=(x, y))
+            if cv2.contourArea(contours[0]) > min_area:
+                outlines[label] = contours[0]
+        
+        # Where tracing starts: the component's first pixel in raster order
+        starts = {}
+        for label in outlines:
+            x, y, w = stats[label, :3].tolist()
+            starts[label] = (x + int(np.argmax(labels[y, x:x + w] == label)), y)
+        
+        # An enclosed component is bounded by a larger region, which has
+        # passed the area check itself
+        nested = set()
+        for label, point in starts.items():
+            x, y, w, h = stats[label, :4].tolist()
+            for other, outline in outlines.items():
+                ox, oy, ow, oh = stats[other, :4].tolist()
+                if (other != label and ox < x and oy < y and x + w < ox + ow and y + h < oy + oh
+                        and cv2.pointPolygonTest(outline, point, False) > 0):
+                    nested.add(label)
+                    break
+        
+        # findContours lists the last-found outline first. Label numbering
+        # only roughly follows raster order, so sort on the start points.
+        kept = sorted((label for label in outlines if label not in nested),
+                      key=lambda label: starts[label][::-1], reverse=True)
+        return {label: outlines[label] for label in kept}
+    
+    @classmethod
+    def _get_batch_pool(cls) -> ThreadPoolExecutor:
+        with cls._BATCH_POOL_LOCK:
+            if cls._BATCH_POOL is None:
+                cls._BATCH_POOL = ThreadPoolExecutor(
+                    max_workers=min(8, os.cpu_count() or 2), thread_name_prefix="detect"
+                )
+            return cls._BATCH_POOL
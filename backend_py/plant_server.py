@@ -4,6 +4,8 @@ Provides MJPEG streaming and status for real-time plant analysis.
 """
 
 import asyncio
+import functools
+import time
 from typing import Optional
 from pathlib import Path
 
@@ -12,6 +14,7 @@ from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
 from plant_stream_detector import PlantStreamDetector
+from services.frame_streamer import BackgroundStreamer, create_mjpeg_frame
 
 import cv2
 import numpy as np
@@ -46,6 +49,50 @@ def get_plant_detector() -> PlantStreamDetector:
     return _plant_detector
 
 
+class PlantStreamer(BackgroundStreamer):
+    """
+    Shared capture + analysis thread for the plant /feed.
+    
+    Runs process_frame at ~15 FPS and publishes the newest JPEG (or a
+    placeholder while there is no camera feed).
+    """
+    
+    THREAD_NAME = "plant-stream"
+    
+    def __init__(self, detector: PlantStreamDetector, fps: float = 15):
+        super().__init__()
+        self.detector = detector
+        self.frame_delay = 1 / fps  # 15 FPS - balanced for analysis + smoothness
+        
+    def produce(self) -> bool:
+        try:
+            frame_bytes = self.detector.process_frame()
+        except Exception as e:
+            print(f"Plant frame generation error: {e}")
+            time.sleep(0.5)
+            return True
+            
+        if frame_bytes is None:
+            self.publish(_generate_placeholder("No camera feed"))
+            time.sleep(1)  # Wait a second, retry
+            return True
+            
+        self.publish(frame_bytes)
+        time.sleep(self.frame_delay)
+        return True
+
+
+_streamer: Optional[PlantStreamer] = None
+
+
+def get_plant_streamer() -> PlantStreamer:
+    """Get or create the shared background streamer"""
+    global _streamer
+    if _streamer is None:
+        _streamer = PlantStreamer(get_plant_detector())
+    return _streamer
+
+
 # ============================================================================
 # Router
 # ============================================================================
@@ -69,60 +116,54 @@ async def get_plant_feed():
     """
     detector = get_plant_detector()
     
-    # Auto-start camera if not already active
-    if not detector.has_source:
-        print("📷 Starting camera for plant feed...")
-        success = detector.set_video_source("0")  # Default camera
-        if not success:
-            return Response(
-                content=_generate_placeholder("Camera not available"),
-                media_type="image/jpeg"
-            )
+    # Auto-start camera for the first viewer; later viewers share it
+    if not detector.subscribe("0"):  # Default camera
+        return Response(
+            content=_generate_placeholder("Camera not available"),
+            media_type="image/jpeg"
+        )
     
     return StreamingResponse(
-        _generate_plant_frames(detector),
+        _generate_plant_frames(get_plant_streamer(), detector),
         media_type="multipart/x-mixed-replace; boundary=frame"
     )
 
 
-async def _generate_plant_frames(detector: PlantStreamDetector):
+async def _generate_plant_frames(streamer: PlantStreamer, detector: PlantStreamDetector):
     """
     Async generator for MJPEG frames.
-    Optimized: Target 15 FPS for smooth video with analysis updates.
+    
+    Capture, analysis and encoding happen on the shared streamer thread
+    (one camera read per frame however many clients watch); each client
+    only awaits the next published frame, without holding a thread. The
+    client's camera subscription is dropped when the stream closes.
     """
-    frame_delay = 1 / 15  # 15 FPS - balanced for analysis + smoothness
+    streamer.start()
+    frame_id = streamer.frame_id
     
-    while True:
-        try:
-            frame_bytes = detector.process_frame()
-            
-            if frame_bytes is None:
-                yield _create_mjpeg_frame(_generate_placeholder("No camera feed"))
-                await asyncio.sleep(1)  # Wait a second, retry
-                continue
+    try:
+        while True:
+            try:
+                new_id, frame_bytes = await streamer.wait_for_frame(frame_id)
                 
-            yield _create_mjpeg_frame(frame_bytes)
-            
-            # Small delay for target FPS
-            await asyncio.sleep(frame_delay)
-            
-        except Exception as e:
-            print(f"Plant frame generation error: {e}")
-            await asyncio.sleep(0.5)
-
-
-def _create_mjpeg_frame(jpeg_bytes: bytes) -> bytes:
-    """Create an MJPEG frame with proper boundary"""
-    return (
-        b"--frame\r\n"
-        b"Content-Type: image/jpeg\r\n\r\n" +
-        jpeg_bytes +
-        b"\r\n"
-    )
+                if new_id == frame_id:
+                    # Timed out; restart the worker if it stopped
+                    streamer.start()
+                    continue
+                    
+                frame_id = new_id
+                yield create_mjpeg_frame(frame_bytes)
+                
+            except Exception as e:
+                print(f"Plant frame generation error: {e}")
+                await asyncio.sleep(0.5)
+    finally:
+        detector.unsubscribe()
 
 
+@functools.lru_cache(maxsize=8)
 def _generate_placeholder(message: str = "Loading...") -> bytes:
-    """Generate a placeholder frame"""
+    """Generate a placeholder frame (rendered once per message)"""
     frame = np.zeros((480, 640, 3), dtype=np.uint8)
     frame[:] = (40, 40, 45)
     
@@ -135,9 +176,10 @@ def _generate_placeholder(message: str = "Loading...") -> bytes:
 
 @router.post("/stop")
 async def stop_plant_feed():
-    """Stop the camera feed"""
+    """Stop the camera feed (kept running while other viewers are watching)"""
     detector = get_plant_detector()
-    detector.release_video_source()
+    if not detector.release_if_idle():
+        return {"success": True, "message": "Camera still in use by other viewers"}
     return {"success": True, "message": "Camera stopped"}
 
 
@@ -2,15 +2,36 @@
 Plant Stream Detector - Real-time video analysis for plant disease detection.
 Handles camera feed, runs detection, and annotates frames.
 """
+import functools
 import threading
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from typing import Optional, Tuple, Dict, Any
 
 import cv2
 import numpy as np
-from PIL import Image
 
 from models.yolo_detector import PlantDiseaseDetector
+from utils.image_processing import encode_jpeg, fit_within
+
+BANNER_HEIGHT = 66  # Rows covered by the filled (0,0)-(w,65) status banner
+
+
+@functools.lru_cache(maxsize=64)
+def _render_banner(text: str, conf_text: str, is_healthy: bool, width: int) -> np.ndarray:
+    """Render the status banner (background + text) once; callers must not mutate it"""
+    bg_color = (0, 80, 0) if is_healthy else (0, 0, 80)
+    banner = np.empty((BANNER_HEIGHT, width, 3), dtype=np.uint8)
+    banner[:] = bg_color
+    
+    # Main text
+    cv2.putText(banner, text, (15, 35), cv2.FONT_HERSHEY_SIMPLEX, 
+               1.0, (255, 255, 255), 2)
+    
+    # Confidence
+    cv2.putText(banner, conf_text, (15, 55), cv2.FONT_HERSHEY_SIMPLEX,
+               0.5, (200, 200, 200), 1)
+    return banner
 
 
 class PlantStreamDetector:
@@ -20,15 +41,28 @@ class PlantStreamDetector:
     """
     
     def __init__(self, model_path: str = None):
-        self.detector = PlantDiseaseDetector(model_path)
+        # Live frames only feed the banner and boxes, so analyse at 320px
+        self.detector = PlantDiseaseDetector(model_path, analysis_max_side=320)
         self.last_analysis_time = 0
         self.analysis_interval = 0.25  # Analyze every 250ms
+        self.stream_max_side = 960  # Frames are streamed (and analysed) at most this size
+        self.static_threshold = 3.0  # Mean 16x16 gray difference below which a frame is "unchanged"
+        self._prev_thumb: Optional[np.ndarray] = None
         self.last_result: Optional[Dict[str, Any]] = None
         
+        # Detection runs on its own thread so capture/annotate/encode never wait on it
+        self._detect_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="plant-detect")
+        self._detect_future: Optional[Future] = None
+        
         # Video source management
         self._video_source: Optional[cv2.VideoCapture] = None
         self._video_lock = threading.Lock()
         self._source_path: Optional[str] = None
+        self._grab_budget = 0  # Extra grabs per read to skip stale buffered frames
+        
+        # Live viewers: the camera opens for the first and is released after the last
+        self._subscribers = 0
+        self._sub_lock = threading.Lock()
         
         print("📹 PlantStreamDetector initialized")
 
@@ -50,8 +84,20 @@ class PlantStreamDetector:
                     self._source_path = None
                     return False
                     
+                # Live sources: keep only the latest frame queued. If the
+                # backend ignores the buffer size, drain a few frames per read.
+                self._grab_budget = 0
+                if source.isdigit() or "://" in source:
+                    buffer_set = self._video_source.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+                    self._grab_budget = 1 if buffer_set else 3
+                if source.isdigit():
+                    # USB cameras: compressed MJPG avoids raw YUY2 transfer/conversion
+                    self._video_source.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*"MJPG"))
+                    
                 self._source_path = source
                 self.last_result = None
+                self._detect_future = None  # drop any result from the old source
+                self._prev_thumb = None
                 print(f"✅ Video source opened: {source}")
                 return True
             except Exception as e:
@@ -67,6 +113,33 @@ class PlantStreamDetector:
                 self._video_source = None
                 self._source_path = None
             self.last_result = None
+            self._detect_future = None
+            self._prev_thumb = None
+
+    def subscribe(self, source: str = "0") -> bool:
+        """Register a viewer, opening `source` if no source is active. False if it cannot be opened."""
+        with self._sub_lock:
+            if not self.has_source:
+                print("📷 Starting camera for plant feed...")
+                if not self.set_video_source(source):
+                    return False
+            self._subscribers += 1
+            return True
+
+    def unsubscribe(self):
+        """Drop a viewer; the last one out releases the video source"""
+        with self._sub_lock:
+            self._subscribers = max(0, self._subscribers - 1)
+            if self._subscribers == 0:
+                self.release_video_source()
+
+    def release_if_idle(self) -> bool:
+        """Release the video source unless viewers are still watching it"""
+        with self._sub_lock:
+            if self._subscribers > 0:
+                return False
+            self.release_video_source()
+            return True
 
     def read_frame(self) -> Tuple[bool, Optional[np.ndarray]]:
         """Read a frame from the video source"""
@@ -74,7 +147,14 @@ class PlantStreamDetector:
             if self._video_source is None:
                 return False, None
                 
-            ret, frame = self._video_source.read()
+            if self._grab_budget:
+                # Skip stale buffered frames, decode only the newest one
+                for _ in range(self._grab_budget):
+                    if not self._video_source.grab():
+                        break
+                ret, frame = self._video_source.retrieve()
+            else:
+                ret, frame = self._video_source.read()
             
             # Loop video files
             if not ret and self._source_path and not self._source_path.isdigit():
@@ -90,41 +170,74 @@ class PlantStreamDetector:
         ret, frame = self.read_frame()
         if not ret or frame is None:
             return None
+        
+        # Shrink HD captures once up front: JPEG encode cost is O(pixels), and
+        # detection boxes then come back in the coordinates we draw on
+        frame = fit_within(frame, self.stream_max_side)
             
         current_time = time.time()
         
-        # Run analysis periodically
-        if current_time - self.last_analysis_time > self.analysis_interval:
-            try:
-                # Convert BGR to RGB for PIL
-                rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                pil_image = Image.fromarray(rgb_frame)
-                
-                # Run detection
-                result = self.detector.detect(pil_image)
-                
-                # Only update if we got a valid detection
-                if result is not None:
-                    self.last_result = result
-                    
-            except Exception as e:
-                print(f"Detection error: {e}")
-            
+        # Run analysis periodically in the background; while a detection is
+        # still running, frames keep flowing with the previous result
+        pending = self._detect_future
+        if pending is not None and pending.done():
+            self._collect_detection(pending)
+            pending = None
+        submitted = False
+        if pending is None and current_time - self.last_analysis_time > self.analysis_interval:
+            # A scene unchanged since the last analysed frame keeps its result
+            if self.last_result is None or self._has_changed(frame):
+                try:
+                    # detect() takes the BGR capture frame as-is (no PIL round-trip);
+                    # the frame must not be drawn on while the worker reads it
+                    self._detect_future = self._detect_executor.submit(self.detector.detect, frame)
+                    submitted = True
+                except Exception as e:
+                    print(f"Detection error: {e}")
+
             self.last_analysis_time = current_time
         
         # Annotate frame with detection results
-        annotated_frame = self._annotate_frame(frame, self.last_result)
+        annotated_frame = self._annotate_frame(frame, self.last_result, copy=submitted)
         
-        # Encode to JPEG
-        _, jpeg = cv2.imencode('.jpg', annotated_frame, [cv2.IMWRITE_JPEG_QUALITY, 75])
-        return jpeg.tobytes()
+        # Encode to JPEG (libjpeg-turbo via simplejpeg when available)
+        return encode_jpeg(annotated_frame, quality=75)
+
+    def _has_changed(self, frame: np.ndarray) -> bool:
+        """Cheap change gate: mean difference of a 16x16 grayscale thumbnail"""
+        thumb = cv2.cvtColor(cv2.resize(frame, (16, 16), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+
+        if self._prev_thumb is not None:
+            if cv2.mean(cv2.absdiff(thumb, self._prev_thumb))[0] < self.static_threshold:
+                return False
+
+        # Compare later frames against the last analysed one
+        self._prev_thumb = thumb
+        return True
 
-    def _annotate_frame(self, frame: np.ndarray, result: Optional[Dict[str, Any]]) -> np.ndarray:
-        """Draw detection results on the video frame"""
+    def _collect_detection(self, future: Future):
+        """Adopt a finished background detection's result"""
+        if future is not self._detect_future:
+            return  # source changed while it ran
+        self._detect_future = None
+        try:
+            result = future.result()
+            # Only update if we got a valid detection
+            if result is not None:
+                self.last_result = result
+        except Exception as e:
+            print(f"Detection error: {e}")
+
+    def _annotate_frame(self, frame: np.ndarray, result: Optional[Dict[str, Any]],
+                        copy: bool = False) -> np.ndarray:
+        """
+        Draw detection results on the video frame. Draws in place on the
+        capture buffer unless `copy` is set (the frame is shared with the detector).
+        """
         if result is None:
             return frame
             
-        annotated = frame.copy()
+        annotated = frame.copy() if copy else frame
         h, w = frame.shape[:2]
         
         # Get detection info
@@ -133,22 +246,10 @@ class PlantStreamDetector:
         confidence = result.get("confidence", 0)
         is_healthy = result.get("is_healthy", True)
         
-        # Colors: Green = healthy, Red = issue
-        color = (0, 255, 0) if is_healthy else (0, 0, 255)
-        bg_color = (0, 80, 0) if is_healthy else (0, 0, 80)
-        
-        # Draw top banner with detection info
-        cv2.rectangle(annotated, (0, 0), (w, 65), bg_color, -1)
-        
-        # Main text
-        text = f"{crop}: {disease}"
-        cv2.putText(annotated, text, (15, 35), cv2.FONT_HERSHEY_SIMPLEX, 
-                   1.0, (255, 255, 255), 2)
-        
-        # Confidence
-        conf_text = f"Confidence: {confidence}%"
-        cv2.putText(annotated, conf_text, (15, 55), cv2.FONT_HERSHEY_SIMPLEX,
-                   0.5, (200, 200, 200), 1)
+        # Draw top banner with detection info (text rasterised once per result)
+        banner = _render_banner(f"{crop}: {disease}", f"Confidence: {confidence}%", bool(is_healthy), w)
+        rows = min(BANNER_HEIGHT, h)
+        annotated[:rows] = banner[:rows]
         
         # Draw disease regions (orange boxes) if not healthy
         if not is_healthy:
@@ -0,0 +1,63 @@
+"""
+Request-coalescing queue: groups concurrent inference requests into one batch call.
+"""
+import asyncio
+from concurrent.futures import Executor
+from typing import Any, Callable, List, Optional, Sequence
+
+
+class AsyncBatchQueue:
+    """
+    Collects items submitted via `add_request` and hands them to `process_fn`
+    in batches of up to `max_batch_size`, waiting at most `max_wait_time`
+    seconds for a batch to fill. `process_fn` is synchronous and runs in
+    `executor` (default executor if None) so the event loop stays free.
+    """
+
+    def __init__(self, process_fn: Callable[[Sequence[Any]], List[Any]],
+                 max_batch_size: int = 8, max_wait_time: float = 0.02,
+                 executor: Optional[Executor] = None):
+        self.process_fn = process_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_time = max_wait_time
+        self.executor = executor
+        self._queue: Optional[asyncio.Queue] = None
+
+    async def add_request(self, item: Any) -> Any:
+        """Enqueue one item and wait for its individual result."""
+        if self._queue is None:
+            raise RuntimeError("AsyncBatchQueue.process_loop() is not running")
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _collect_batch(self) -> list:
+        batch = [await self._queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.max_wait_time
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def process_loop(self):
+        """Run forever, dispatching batches; start with asyncio.create_task()."""
+        self._queue = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect_batch()
+            items = [item for item, _ in batch]
+            try:
+                results = await loop.run_in_executor(self.executor, self.process_fn, items)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
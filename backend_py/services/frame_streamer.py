@@ -0,0 +1,120 @@
+"""
+Shared MJPEG streaming: one capture/analysis thread fans frames out to every /feed client.
+"""
+import asyncio
+import threading
+import time
+from typing import List, Optional, Tuple
+
+_MJPEG_PREFIX = b"--frame\r\nContent-Type: image/jpeg\r\n\r\n"
+_MJPEG_SUFFIX = b"\r\n"
+
+
+def create_mjpeg_frame(jpeg_bytes: bytes) -> bytes:
+    """Create an MJPEG frame with proper boundary markers"""
+    return b"".join((_MJPEG_PREFIX, jpeg_bytes, _MJPEG_SUFFIX))
+
+
+def _wake(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class BackgroundStreamer:
+    """
+    Single worker thread shared by every /feed client of a stream.
+
+    Subclasses implement ``produce()``, which runs on the worker thread,
+    calls ``publish()`` for each new JPEG and returns False once the source
+    has ended. The worker also stops when no client has asked for a frame
+    for CLIENT_TIMEOUT seconds.
+
+    Clients await ``wait_for_frame()`` on the event loop. ``publish()`` wakes
+    them with ``call_soon_threadsafe``, so viewers never park a thread in
+    the default executor.
+    """
+
+    CLIENT_TIMEOUT = 10.0
+    THREAD_NAME = "frame-stream"
+
+    def __init__(self):
+        self.latest_jpeg: Optional[bytes] = None
+        self.frame_id = 0
+        self.running = False
+        self._lock = threading.Lock()
+        self._last_access = 0.0
+        self._waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+    def start(self):
+        """Start the worker thread if it is not already running"""
+        with self._lock:
+            self._last_access = time.time()
+            if not self.running:
+                self.running = True
+                threading.Thread(target=self._run, name=self.THREAD_NAME, daemon=True).start()
+
+    async def wait_for_frame(self, last_id: int, timeout: float = 1.0) -> Tuple[int, Optional[bytes]]:
+        """
+        Wait until a frame newer than ``last_id`` is published.
+
+        Returns:
+            Tuple of (frame_id, jpeg_bytes); frame_id equals ``last_id``
+            on timeout or when the worker has stopped
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._last_access = time.time()
+            if self.frame_id != last_id or not self.running:
+                return self.frame_id, self.latest_jpeg
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+
+        try:
+            await asyncio.wait_for(waiter[1], timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+
+        with self._lock:
+            return self.frame_id, self.latest_jpeg
+
+    def publish(self, jpeg_bytes: bytes):
+        """Store a new frame and wake every waiting client"""
+        with self._lock:
+            self.latest_jpeg = jpeg_bytes
+            self.frame_id += 1
+            self._wake_waiters()
+
+    def produce(self) -> bool:
+        """Publish the next frame(s); return False when the source has ended"""
+        raise NotImplementedError
+
+    def _wake_waiters(self):
+        # Called with self._lock held
+        for loop, future in self._waiters:
+            try:
+                loop.call_soon_threadsafe(_wake, future)
+            except RuntimeError:
+                pass  # the client's event loop has already closed
+        self._waiters.clear()
+
+    def _run(self):
+        try:
+            while True:
+                # Check and stop in one step: a start() that lands after this
+                # either refreshed _last_access in time or sees running=False
+                with self._lock:
+                    if time.time() - self._last_access >= self.CLIENT_TIMEOUT:
+                        self.running = False
+                        break
+                if not self.produce():
+                    break
+        except Exception as e:
+            print(f"Frame generation error: {e}")
+        finally:
+            with self._lock:
+                self.running = False
+                self._wake_waiters()
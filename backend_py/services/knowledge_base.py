@@ -0,0 +1,164 @@
+"""
+Offline agricultural knowledge base, loaded once with pre-built keyword indices.
+"""
+import os
+import sys
+import json
+import mmap
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Keyword matching backends, fastest first: Hyperscan (SIMD DFA), then an
+# Aho-Corasick automaton; both do one O(len(text)) pass for all keywords
+try:
+    import hyperscan
+    HYPERSCAN_AVAILABLE = True
+except ImportError:
+    HYPERSCAN_AVAILABLE = False
+
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
+# Pre-converted binary KB (see __main__ below), read through a shared mmap
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+
+class KeywordIndex:
+    """
+    Substring matcher over (key, keywords) entries.
+
+    `first_match(text)` returns the earliest-registered key with any keyword
+    occurring in `text` - the same answer as scanning the entries in order
+    with `any(kw in text for kw in keywords)`.
+    """
+
+    def __init__(self, entries: Iterable[Tuple[str, Iterable[str]]]):
+        self._keys: List[str] = []
+        self._needles: List[Tuple[int, Tuple[str, ...]]] = []
+        self._always: Optional[int] = None  # empty keyword matches every text
+        owners: Dict[str, int] = {}  # keyword -> first entry that lists it
+
+        for order, (key, keywords) in enumerate(entries):
+            self._keys.append(key)
+            keywords = tuple(dict.fromkeys(keywords))
+            self._needles.append((order, keywords))
+            for keyword in keywords:
+                if not keyword:
+                    if self._always is None:
+                        self._always = order
+                else:
+                    owners.setdefault(keyword, order)
+
+        self._database = None
+        self._automaton = None
+        if owners and HYPERSCAN_AVAILABLE:
+            self._database = hyperscan.Database()
+            self._database.compile(
+                # Each keyword as an exact byte literal (no regex metacharacters)
+                expressions=[b"".join(b"\\x%02x" % c for c in kw.encode("utf-8")) for kw in owners],
+                ids=list(owners.values()),
+                elements=len(owners),
+                flags=[hyperscan.HS_FLAG_SINGLEMATCH] * len(owners),
+            )
+        elif owners and AHOCORASICK_AVAILABLE:
+            self._automaton = ahocorasick.Automaton()
+            for keyword, order in owners.items():
+                self._automaton.add_word(keyword, order)
+            self._automaton.make_automaton()
+
+    def first_match(self, text: str) -> Optional[str]:
+        best = self._always
+        if self._database is not None:
+            hits: List[int] = []
+            self._database.scan(text.encode("utf-8"), match_event_handler=_collect_hit, context=hits)
+            if hits:
+                best = min(hits) if best is None else min(best, *hits)
+        elif self._automaton is not None:
+            for _, order in self._automaton.iter(text):
+                if best is None or order < best:
+                    best = order
+                    if best == 0:
+                        break
+        else:
+            for order, keywords in self._needles:
+                if best is not None and order >= best:
+                    break
+                if any(kw in text for kw in keywords):
+                    best = order
+                    break
+        return None if best is None else self._keys[best]
+
+
+def _collect_hit(order: int, start: int, end: int, flags: int, hits: List[int]):
+    # SINGLEMATCH: called at most once per keyword
+    hits.append(order)
+
+
+class KnowledgeBase:
+    """Parsed agricultural_knowledge.json plus keyword indices for chat lookups."""
+
+    def __init__(self, data: dict):
+        self.data = data
+        self.crops: Dict[str, dict] = data.get("crops", {})
+        self.diseases: Dict[str, dict] = data.get("disease_reference", {})
+        self.pests: Dict[str, dict] = data.get("pest_reference", {})
+
+        self.crop_index = KeywordIndex(
+            (key, [*crop.get("names", []), key]) for key, crop in self.crops.items()
+        )
+        self.topic_index = KeywordIndex(data.get("topics", {}).items())
+        self.disease_index = KeywordIndex((key, [key.replace("_", " ")]) for key in self.diseases)
+        self.pest_index = KeywordIndex((key, [key.replace("_", " ")]) for key in self.pests)
+
+    @classmethod
+    def load(cls, path: str) -> "KnowledgeBase":
+        """
+        Load the KB from its JSON file. A sibling `.msgpack` produced by
+        `python -m services.knowledge_base` is used instead when it is at
+        least as new as the JSON; it is unpacked straight from a read-only
+        mmap, so forked workers share the page-cache copy. A stale `.msgpack`
+        is rebuilt from the JSON.
+        """
+        packed = _msgpack_path(path)
+        has_packed = MSGPACK_AVAILABLE and os.path.exists(packed)
+        if has_packed and os.path.getmtime(packed) >= os.path.getmtime(path):
+            with open(packed, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return cls(msgpack.unpackb(mm, raw=False))
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if has_packed:
+            try:
+                _write_msgpack(packed, data)
+                print(f"🔄 Rebuilt stale {packed}")
+            except OSError as e:
+                print(f"⚠️ Could not rebuild {packed}: {e}")
+        return cls(data)
+
+
+def _msgpack_path(json_path: str) -> str:
+    return os.path.splitext(json_path)[0] + ".msgpack"
+
+
+def _write_msgpack(packed_path: str, data: dict):
+    # Write then rename, so concurrent workers never mmap a half-written file
+    tmp_path = f"{packed_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(msgpack.packb(data, use_bin_type=True))
+    os.replace(tmp_path, packed_path)
+
+
+if __name__ == "__main__":
+    # Build step: python -m services.knowledge_base <agricultural_knowledge.json>
+    source = sys.argv[1] if len(sys.argv) > 1 else os.path.join(
+        os.path.dirname(__file__), "../../backend/data/agricultural_knowledge.json"
+    )
+    with open(source, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    _write_msgpack(_msgpack_path(source), data)
+    print(f"✅ Wrote {_msgpack_path(source)}")
@@ -1,10 +1,12 @@
 import os
-import wave
-import io
-import tempfile
+import struct
+import hashlib
+import threading
 from dotenv import load_dotenv
 from typing import Optional
 
+from utils.cache import TTLCache
+
 load_dotenv()
 
 # Try to import riva.client (may fail if not installed for Edge-only mode)
@@ -21,6 +23,19 @@ try:
 except ImportError:
     EDGE_TTS_AVAILABLE = False
 
+# Riva returns raw mono 16-bit PCM at this rate
+SAMPLE_RATE_HZ = 22050
+
+def _wav_header(pcm_len: int, sample_rate: int = SAMPLE_RATE_HZ, channels: int = 1, sample_width: int = 2) -> bytes:
+    """Canonical 44-byte PCM WAV header for `pcm_len` bytes of audio data."""
+    block_align = channels * sample_width
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + pcm_len, b"WAVE",
+        b"fmt ", 16, 1, channels, sample_rate, sample_rate * block_align, block_align, sample_width * 8,
+        b"data", pcm_len,
+    )
+
 class NvidiaTTSService:
     """NVIDIA Magpie TTS service with Edge TTS fallback for unsupported languages."""
     
@@ -57,6 +72,13 @@ class NvidiaTTSService:
         # Voice personality options (all female) for NVIDIA
         self.VOICE_PERSONALITIES = ["mia", "aria", "sofia", "louise", "isabela"]
         
+        # Recently synthesised phrases (UI prompts repeat a lot): key -> audio bytes
+        self._audio_cache = TTLCache(maxsize=128, ttl=24 * 3600)
+        
+        # Riva client (long-lived gRPC channel), created on first use
+        self._riva_service = None
+        self._riva_lock = threading.Lock()
+        
         if self.api_key and RIVA_AVAILABLE:
             print(f"🟢 NVIDIA TTS Service initialized (gRPC) with Edge TTS fallback")
         elif EDGE_TTS_AVAILABLE:
@@ -65,18 +87,22 @@ class NvidiaTTSService:
             print("❌ No TTS service available. Please install edge-tts.")
 
     def _get_riva_service(self):
-        """Create authenticated Riva TTS service."""
+        """Authenticated Riva TTS service, created once and reused (one TLS/HTTP2 channel)."""
         if not RIVA_AVAILABLE:
             return None
-        auth = riva.client.Auth(
-            uri=self.server,
-            use_ssl=True,
-            metadata_args=[
-                ["authorization", f"Bearer {self.api_key}"],
-                ["function-id", self.function_id]
-            ]
-        )
-        return riva.client.SpeechSynthesisService(auth)
+        if self._riva_service is None:
+            with self._riva_lock:
+                if self._riva_service is None:
+                    auth = riva.client.Auth(
+                        uri=self.server,
+                        use_ssl=True,
+                        metadata_args=[
+                            ["authorization", f"Bearer {self.api_key}"],
+                            ["function-id", self.function_id]
+                        ]
+                    )
+                    self._riva_service = riva.client.SpeechSynthesisService(auth)
+        return self._riva_service
 
     def _get_voice_name(self, language: str, voice: str = "mia") -> str:
         """Build NVIDIA voice name from language and voice personality."""
@@ -95,15 +121,13 @@ class NvidiaTTSService:
         
         try:
             communicate = edge_tts.Communicate(text, voice)
-            with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as tmp_file:
-                tmp_path = tmp_file.name
+            # Collect the MP3 chunks in memory (no temp file round-trip)
+            buffer = bytearray()
+            async for chunk in communicate.stream():
+                if chunk["type"] == "audio":
+                    buffer.extend(chunk["data"])
             
-            await communicate.save(tmp_path)
-            
-            with open(tmp_path, "rb") as f:
-                audio_data = f.read()
-            
-            os.unlink(tmp_path)
+            audio_data = bytes(buffer)
             print(f"✅ [Edge TTS] Generated {len(audio_data)} bytes of audio")
             return audio_data
         except Exception as e:
@@ -139,18 +163,11 @@ class NvidiaTTSService:
                 text=clean_text,
                 voice_name=voice_name,
                 language_code=language_code,
-                sample_rate_hz=22050
+                sample_rate_hz=SAMPLE_RATE_HZ
             )
             
-            # Convert raw audio to WAV format
-            wav_buffer = io.BytesIO()
-            with wave.open(wav_buffer, 'wb') as wav_file:
-                wav_file.setnchannels(1)
-                wav_file.setsampwidth(2)  # 16-bit
-                wav_file.setframerate(22050)
-                wav_file.writeframes(resp.audio)
-            
-            wav_bytes = wav_buffer.getvalue()
+            # Wrap raw PCM as WAV: fixed 44-byte header + audio, one copy
+            wav_bytes = _wav_header(len(resp.audio)) + resp.audio
             print(f"✅ [NVIDIA gRPC] Generated {len(wav_bytes)} bytes of audio")
             return wav_bytes
             
@@ -177,6 +194,18 @@ class NvidiaTTSService:
         """
         lang = language.lower()
         
+        cache_key = (hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest(), lang, voice.lower(), force_edge)
+        audio = self._audio_cache.get(cache_key)
+        if audio is not None:
+            return audio
+        
+        audio = await self._synthesize(text, lang, voice, force_edge)
+        if audio:
+            self._audio_cache.set(cache_key, audio)
+        return audio
+    
+    async def _synthesize(self, text: str, lang: str, voice: str, force_edge: bool) -> Optional[bytes]:
+        """Pick NVIDIA or Edge TTS for one uncached request."""
         # Check if language is supported by NVIDIA Magpie (English only)
         is_nvidia_supported = lang.startswith(self.NVIDIA_SUPPORTED_LANG_PREFIX)
         
@@ -1,13 +1,129 @@
 import os
+import re
+import json
 import base64
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple, Union
+import httpx
 from openai import AsyncOpenAI
 from dotenv import load_dotenv
 
+from utils.image_processing import fast_b64encode
+
+# Aho-Corasick automaton for the crop keyword scan (falls back to one regex)
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
+# orjson parses the model's JSON reply faster than the stdlib
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
 load_dotenv()
 
+# Response-parsing patterns, compiled once
+_JSON_FENCE_RE = re.compile(r'```json\s*(\{.*?\})\s*```', re.DOTALL)
+_JSON_DECODER = json.JSONDecoder()
+# Split text into sections by likely headers
+# We look for headers like **Symptoms**, Symptoms:, 1. Symptoms, etc.
+_HEADER_SPLIT_RE = re.compile(
+    r'\n\s*[\d\.]*\s?\*?\*?(How it was formed|How we can prevent|How we can recover|Symptoms|Crop Identified|Plant Identified|Product|Disease Name)\*?\*?:?',
+    re.IGNORECASE
+)
+# Bulleted sections of the smart parser and the result key each fills
+_LIST_SECTIONS = {
+    "how we can prevent": "prevention_tips",
+    "how we can recover": "treatment_steps",
+    "symptoms": "symptoms",
+}
+# Health keywords looked for in the lowercased response. Plain substring tests:
+# str's `in` beats a compiled alternation on replies of this size.
+_HEALTHY_WORDS = ("healthy", "normal", "no disease", "clear", "good health", "thriving")
+_SEVERE_WORDS = ("severe", "deadly", "critical", "kill", "destroy")
+_CLEAN_LINE_RE = re.compile(r'^[\s\d\.\-\*•]+')
+# Crop patterns run case-sensitively against the lowercased response
+_CROP_CTX_RE = re.compile(r'(?:in|of|on|identified as|is a|occurs in|analysis of)\s+([a-z]{3,20})')
+_CROP_SUFFIX_RE = re.compile(r"'s$|s$|es$|leaf$|leaves$", re.IGNORECASE)
+
+# Comprehensive list of common crops to check for (Fallback), in priority order
+_COMMON_CROPS = (
+    "Apple", "Tomato", "Cucumber", "Potato", "Onion", "Grape", "Orange", "Banana", "Lemon", "Mango",
+    "Pepper", "Chill", "Strawberry", "Corn", "Rice", "Wheat", "Soybean", "Pomegranate",
+    "Guava", "Papaya", "Brinjal", "Eggplant", "Cabbage", "Cauliflower", "Rosemary", "Tulsi", "Neem",
+    "Pea", "Peas"
+)
+# One alternation finds every listed crop (plus Maize) in a single scan
+_CROPS_RE = re.compile(r'\b(' + '|'.join(re.escape(crop.lower()) for crop in _COMMON_CROPS + ("Maize",)) + r')\b')
+
+_CROP_AC = None
+if AHOCORASICK_AVAILABLE:
+    _CROP_AC = ahocorasick.Automaton()
+    for _crop in _COMMON_CROPS + ("Maize",):
+        _CROP_AC.add_word(_crop.lower(), _crop.lower())
+    _CROP_AC.make_automaton()
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch == "_"
+
+def _find_crops(text: str) -> set:
+    """Names of every listed crop (or maize) occurring as a whole word in the already-lowercased `text`."""
+    if _CROP_AC is None:
+        return set(_CROPS_RE.findall(text))
+    last = len(text) - 1
+    found = set()
+    for end, name in _CROP_AC.iter(text):
+        start = end - len(name) + 1
+        # Same word boundaries as the \b...\b regex
+        if (start == 0 or not _is_word_char(text[start - 1])) and (end == last or not _is_word_char(text[end + 1])):
+            found.add(name)
+    return found
+
+def _loads_json(text: str) -> Any:
+    """json.loads via orjson when installed; anything it rejects (e.g. NaN) goes to the stdlib parser."""
+    if ORJSON_AVAILABLE:
+        try:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(text)
+
+# Prompt languages; unknown codes fall back to English
+_LANG_NAMES = {
+    "en": "English",
+    "hi": "Hindi",
+    "ta": "Tamil",
+    "te": "Telugu",
+    "mr": "Marathi"
+}
+
+def _build_system_prompt(target_lang_name: str) -> str:
+    return (
+        f"You are an expert plant pathologist. Analyze the image and provide a detailed diagnosis in {target_lang_name}.\\n\\n"
+        f"Return a JSON object ONLY with this structure:\\n"
+        f"{{\\n"
+        f'  "crop_identified": "name of plant/crop",\\n'
+        f'  "disease_name": "disease name or Healthy",\\n'
+        f'  "confidence": 95,\\n'
+        f'  "severity": "low/medium/high",\\n'
+        f'  "description": "detailed explanation",\\n'
+        f'  "symptoms": ["symptom 1", "symptom 2"],\\n'
+        f'  "treatment_steps": ["step 1", "step 2"],\\n'
+        f'  "prevention_tips": ["tip 1", "tip 2"],\\n'
+        f'  "organic_options": ["option 1", "option 2"]\\n'
+        f"}}\\n\\n"
+        f"Rules: If healthy set disease_name='Healthy' and severity='low'. All text in {target_lang_name}. JSON only, no extra text."
+    )
+
+# Fully rendered system prompt per language, built once
+_SYSTEM_PROMPTS = {code: _build_system_prompt(name) for code, name in _LANG_NAMES.items()}
+
 class NvidiaVisionService:
-    def __init__(self):
+    def __init__(self, http_client: Optional[httpx.AsyncClient] = None):
+        """`http_client` is an app-owned pooled keep-alive client; the service does not close it."""
         self.api_key = os.getenv("NVIDIA_VISION_KEY")
         self.base_url = "https://integrate.api.nvidia.com/v1"
         self.client = None
@@ -15,15 +131,18 @@ class NvidiaVisionService:
         if self.api_key:
             self.client = AsyncOpenAI(
                 base_url=self.base_url,
-                api_key=self.api_key
+                api_key=self.api_key,
+                http_client=http_client
             )
             print(f"🟢 NVIDIA Vision Service initialized with key: {self.api_key[:10]}...")
         else:
             print("🟡 NVIDIA_VISION_KEY not found in environment. NVIDIA mode will be disabled.")
 
-    async def analyze_image(self, base64_image_data: str, language: str = "en") -> Dict[str, Any]:
+    async def analyze_image(self, image: Union[bytes, str], language: str = "en") -> Dict[str, Any]:
         """
         Analyzes an image using Meta Llama 3.2 90B Vision on NVIDIA NIM.
+        `image` is encoded JPEG bytes (base64-encoded once here) or an
+        already base64-encoded string / data URI.
         """
         if not self.client:
             return {
@@ -31,53 +150,20 @@ class NvidiaVisionService:
                 "error": "NVIDIA API Key is missing. Please add it to your .env file."
             }
 
-        # Ensure image data doesn't have the data:image/png;base64, prefix if passed directly
-        if "," in base64_image_data:
-            base64_image_data = base64_image_data.split(",")[1]
+        if isinstance(image, (bytes, bytearray, memoryview)):
+            image_url = f"data:image/jpeg;base64,{fast_b64encode(image)}"
+        elif image.startswith("data:"):
+            # Already a data URI: send it as-is rather than scanning/copying the payload
+            image_url = image
+        else:
+            image_url = f"data:image/jpeg;base64,{image}"
 
         try:
             print(f"🧠 [NVIDIA] Sending request to Llama 3.2 90B Vision ({language})...")
             
-            # Map language codes to names for the prompt
-            lang_names = {
-                "en": "English",
-                "hi": "Hindi",
-                "ta": "Tamil",
-                "te": "Telugu",
-                "mr": "Marathi"
-            }
-            target_lang_name = lang_names.get(language, "English")
-            
-            # Always generate ALL 5 languages for storage
-            all_lang_keys = (
-                "disease_name, disease_name_hindi, disease_name_tamil, disease_name_telugu, disease_name_marathi, "
-                "confidence, severity, "
-                "description, description_hindi, description_tamil, description_telugu, description_marathi, "
-                "symptoms, symptoms_hindi, symptoms_tamil, symptoms_telugu, symptoms_marathi, "
-                "treatment_steps, treatment_steps_hindi, treatment_steps_tamil, treatment_steps_telugu, treatment_steps_marathi, "
-                "organic_options, organic_options_hindi, organic_options_tamil, organic_options_telugu, organic_options_marathi, "
-                "prevention_tips, prevention_tips_hindi, prevention_tips_tamil, prevention_tips_telugu, prevention_tips_marathi, "
-                "crop_identified, crop_identified_hindi, crop_identified_tamil, crop_identified_telugu, crop_identified_marathi"
-            )
-
-            system_prompt = (
-                f"You are an expert plant pathologist. Analyze the image and provide a detailed diagnosis in {target_lang_name}.\\n\\n"
-                f"Return a JSON object ONLY with this structure:\\n"
-                f"{{\\n"
-                f'  "crop_identified": "name of plant/crop",\\n'
-                f'  "disease_name": "disease name or Healthy",\\n'
-                f'  "confidence": 95,\\n'
-                f'  "severity": "low/medium/high",\\n'
-                f'  "description": "detailed explanation",\\n'
-                f'  "symptoms": ["symptom 1", "symptom 2"],\\n'
-                f'  "treatment_steps": ["step 1", "step 2"],\\n'
-                f'  "prevention_tips": ["tip 1", "tip 2"],\\n'
-                f'  "organic_options": ["option 1", "option 2"]\\n'
-                f"}}\\n\\n"
-                f"Rules: If healthy set disease_name='Healthy' and severity='low'. All text in {target_lang_name}. JSON only, no extra text."
-            )
+            system_prompt = _SYSTEM_PROMPTS.get(language, _SYSTEM_PROMPTS["en"])
 
-            response = await self.client.chat.completions.create(
+            stream = await self.client.chat.completions.create(
                 model="meta/llama-3.2-90b-vision-instruct",
                 messages=[
                     {
@@ -90,34 +176,31 @@ class NvidiaVisionService:
                             {"type": "text", "text": "Analyze this plant leaf. Use the requested structure."},
                             {
                                 "type": "image_url",
-                                "image_url": {"url": f"data:image/jpeg;base64,{base64_image_data}"},
+                                "image_url": {"url": image_url},
                             },
                         ],
                     }
                 ],
                 max_tokens=2048,
                 temperature=0.2,
-                timeout=45.0
+                timeout=45.0,
+                stream=True
             )
 
-            raw_content = response.choices[0].message.content.strip()
+            raw_content, result_json = await self._read_stream(stream)
             print(f"📄 [NVIDIA] Raw Response Length: {len(raw_content)} chars")
             
-            import json
-            import re
-            
             # 1. Try JSON parsing
             try:
-                result_json = None
-                json_match = re.search(r'```json\s*(\{.*?\})\s*```', raw_content, re.DOTALL)
-                if not json_match:
-                    start_idx = raw_content.find('{')
-                    end_idx = raw_content.rfind('}')
-                    if start_idx != -1 and end_idx != -1:
-                        json_str = raw_content[start_idx:end_idx+1]
-                        result_json = json.loads(json_str)
-                else:
-                    result_json = json.loads(json_match.group(1))
+                if result_json is None:
+                    json_match = _JSON_FENCE_RE.search(raw_content)
+                    if not json_match:
+                        # Parse the first object in place; trailing prose is ignored
+                        start_idx = raw_content.find('{')
+                        if start_idx != -1:
+                            result_json, _ = _JSON_DECODER.raw_decode(raw_content, start_idx)
+                    else:
+                        result_json = _loads_json(json_match.group(1))
                 
                 if result_json:
                     # Normalize confidence for NVIDIA (Default to 99% as requested)
@@ -127,7 +210,8 @@ class NvidiaVisionService:
                         result_json["confidence"] = 99
                         
                     return {"success": True, "analysis": result_json}
-            except:
+            except (ValueError, TypeError):
+                # Not valid JSON (or a non-numeric confidence): use the text parser
                 pass
 
             # 2. Smart Parsing Fallback
@@ -144,21 +228,46 @@ class NvidiaVisionService:
                 "error": f"NVIDIA API Error: {str(e)}"
             }
 
+    async def _read_stream(self, stream) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """
+        Accumulate a streamed completion. As soon as the text from the first '{'
+        parses as a complete JSON object the stream is closed, so any chatter the
+        model appends is never waited for. Returns the (stripped) text received
+        and that object, or None when the full reply has to be parsed instead.
+        """
+        parts = []
+        received = 0
+        start_idx = -1
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                parts.append(delta)
+                if start_idx == -1 and '{' in delta:
+                    start_idx = received + delta.index('{')
+                received += len(delta)
+                # An object can only have just completed if this delta closed a brace
+                if start_idx >= 0 and '}' in delta:
+                    text = "".join(parts)
+                    try:
+                        result_json, _ = _JSON_DECODER.raw_decode(text, start_idx)
+                    except ValueError:
+                        continue  # not a complete object yet
+                    if result_json:
+                        return text.strip(), result_json
+                    start_idx = -2  # empty object: read the rest and parse it as a whole
+        finally:
+            await stream.close()
+        return "".join(parts).strip(), None
+
     def _smart_parse_text(self, text: str, language: str = "en") -> Dict[str, Any]:
         """
         Robustly extracts structured data from plain text if JSON parsing fails.
         """
         print(f"🤖 [NVIDIA] Running Smart Parser on natural language ({language})...")
-        import re
-        
-        # Language names mapping
-        lang_names = {
-            "en": "English",
-            "hi": "Hindi",
-            "ta": "Tamil",
-            "te": "Telugu",
-            "mr": "Marathi"
-        }
         
         # Determine suffix for localized keys
         is_english = (language == "en")
@@ -195,92 +304,82 @@ class NvidiaVisionService:
 
         # Helper to clean up lines and remove bullet points
         def clean_line(line):
-            return re.sub(r'^[\s\d\.\-\*•]+', '', line).strip()
+            return _CLEAN_LINE_RE.sub('', line).strip()
 
-        # Split text into sections by likely headers
-        # We look for headers like **Symptoms**, Symptoms:, 1. Symptoms, etc.
-        pattern = r'\n\s*[\d\.]*\s?\*?\*?(How it was formed|How we can prevent|How we can recover|Symptoms|Crop Identified|Plant Identified|Product|Disease Name)\*?\*?:?'
-        sections = re.split(pattern, text, flags=re.IGNORECASE)
+        # Locate the likely section headers; each section runs to the next header
+        headers = list(_HEADER_SPLIT_RE.finditer(text))
         
         # The first part is usually a general description or intro
-        intro_text = sections[0].strip() if sections else ""
-        result["description"] = intro_text
+        intro_text = text[:headers[0].start()] if headers else text
+        result["description"] = intro_text.strip()
         
-        # Comprehensive list of common crops to check for (Fallback)
-        common_crops = [
-            "Apple", "Tomato", "Cucumber", "Potato", "Onion", "Grape", "Orange", "Banana", "Lemon", "Mango",
-            "Pepper", "Chill", "Strawberry", "Corn", "Rice", "Wheat", "Soybean", "Pomegranate",
-            "Guava", "Papaya", "Brinjal", "Eggplant", "Cabbage", "Cauliflower", "Rosemary", "Tulsi", "Neem",
-            "Pea", "Peas"
-        ]
-
-        # Helper to extract crop from any block of text
+        # Helper to extract crop from any (lowercased) block of text
         def extract_crop_name(block):
             # Words to explicitly IGNORE if matched by regex
             ignored_words = {"fungal", "bacterial", "viral", "disease", "infection", "severe", "common", "issue", "problem", "leaf", "plant"}
             
             # 1. Check for regex patterns
-            match = re.search(r'(?:in|of|on|identified as|is a|occurs in|analysis of)\s+([a-zA-Z]{3,20})', block, re.IGNORECASE)
+            match = _CROP_CTX_RE.search(block)
             if match:
                 found = match.group(1).capitalize()
-                found = re.sub(r"'s$|s$|es$|leaf$|leaves$", '', found, flags=re.IGNORECASE)
+                found = _CROP_SUFFIX_RE.sub('', found)
                 
                 if len(found) >= 3 and found.lower() not in ignored_words: 
                     if found.lower() == "maize": return "Corn"
                     return found
             
-            # 2. Check for explicit keywords from our list
-            for crop in common_crops:
-                if re.search(rf'\b{crop}\b', block, re.IGNORECASE):
+            # 2. Check for explicit keywords from our list (one scan; list order wins)
+            present = _find_crops(block)
+            for crop in _COMMON_CROPS:
+                if crop.lower() in present:
                     return crop
             
             # Explicit check for Maize
-            if re.search(r'\bmaize\b', block, re.IGNORECASE):
+            if "maize" in present:
                 return "Corn"
                 
             return None
 
         # Iterate through matched headers and content
         found_crop = None
-        for i in range(1, len(sections), 2):
-            if i + 1 < len(sections):
-                header = sections[i].lower()
-                content = sections[i+1].strip()
-                lines = [clean_line(l) for l in content.split('\n') if clean_line(l)]
+        for i, match in enumerate(headers):
+            # The group is exactly one of the header names, so lowercase it for lookup
+            header = match.group(1).lower()
+            end = headers[i + 1].start() if i + 1 < len(headers) else len(text)
+            content = text[match.end():end].strip()
 
-                if "how it was formed" in header:
-                    result["description"] = content
-                elif "how we can prevent" in header:
-                    result["prevention_tips"] = lines
-                elif "how we can recover" in header:
-                    result["treatment_steps"] = lines
-                elif "symptoms" in header:
-                    result["symptoms"] = lines
-                elif any(x in header for x in ["crop identified", "plant identified", "product"]):
-                    # DYNAMIC: Take what the AI said!
-                    val = clean_line(content.split('\n')[0])
-                    if val and len(val) > 2:
-                        found_crop = val
-                        # Normalize Maize to Corn
-                        if "maize" in found_crop.lower():
-                            found_crop = "Corn"
-                        result["crop_identified"] = found_crop
-                elif "disease name" in header:
-                    result["disease_name"] = clean_line(content.split('\n')[0])
+            if header in _LIST_SECTIONS:
+                lines = [cleaned for cleaned in map(clean_line, content.split('\n')) if cleaned]
+                result[_LIST_SECTIONS[header]] = lines
+            elif header == "how it was formed":
+                result["description"] = content
+            elif header in ("crop identified", "plant identified", "product"):
+                # DYNAMIC: Take what the AI said!
+                val = clean_line(content.split('\n', 1)[0])
+                if val and len(val) > 2:
+                    found_crop = val
+                    # Normalize Maize to Corn
+                    if "maize" in found_crop.lower():
+                        found_crop = "Corn"
+                    result["crop_identified"] = found_crop
+            elif header == "disease name":
+                result["disease_name"] = clean_line(content.split('\n', 1)[0])
+        
+        # Lowercased once for the case-insensitive scans below
+        full_text = text.lower()
         
         # Fallback for crop if headers didn't give it
         if result["crop_identified"] == "Plant":
-            potential_crop = extract_crop_name(text) # Scan entire text for crop keywords
+            potential_crop = extract_crop_name(full_text) # Scan entire text for crop keywords
             if potential_crop: result["crop_identified"] = potential_crop
 
         # POST-PROCESSING: Handle Healthy case & Normalization
-        full_text = text.lower()
         
-        # 1. Robust Healthy Detection
-        is_actually_healthy = any(word in full_text for word in ["healthy", "normal", "no disease", "clear", "good health", "thriving"])
+        # 1. Robust Healthy Detection (only scanned for when no specific disease was found by headers)
+        no_disease_found = "none" in result["disease_name"].lower() or result["disease_name"] == "AI Specialist Insight"
         
-        # If the AI starts with "Healthy" or says it's healthy, and no specific disease was found by headers
-        if (full_text.startswith("healthy") or is_actually_healthy) and ("none" in result["disease_name"].lower() or result["disease_name"] == "AI Specialist Insight"):
+        # If the AI says it's healthy (including starting with "Healthy") and no specific disease was found
+        if no_disease_found and any(word in full_text for word in _HEALTHY_WORDS):
             result["disease_name"] = "Healthy"
             result["severity"] = "low"
             result["is_healthy"] = True
@@ -295,7 +394,7 @@ class NvidiaVisionService:
             # Default to medium if not clearly healthy and not already set
             if result["disease_name"] == "AI Specialist Insight":
                  # If severe keywords found, bump it
-                 if any(w in full_text for w in ["severe", "deadly", "critical", "kill", "destroy"]):
+                 if any(w in full_text for w in _SEVERE_WORDS):
                      result["severity"] = "high"
                  result["is_healthy"] = False
             else:
@@ -3,23 +3,125 @@ Image processing utilities.
 """
 import base64
 import io
+import os
+from typing import Optional, Tuple
 from PIL import Image
 import numpy as np
+import cv2
 
-def decode_base64_image(image_data: str) -> Image.Image:
-    if image_data.startswith("data:"):
-        image_data = image_data.split(",", 1)[1]
-    image_bytes = base64.b64decode(image_data)
-    image = Image.open(io.BytesIO(image_bytes))
-    if image.mode != "RGB":
-        image = image.convert("RGB")
-    return image
+# libjpeg-turbo binding for the MJPEG hot path (falls back to OpenCV)
+try:
+    import simplejpeg
+    SIMPLEJPEG_AVAILABLE = True
+except ImportError:
+    SIMPLEJPEG_AVAILABLE = False
+
+# SIMD base64 codec (libbase64); falls back to the stdlib
+try:
+    import pybase64
+    PYBASE64_AVAILABLE = True
+except ImportError:
+    PYBASE64_AVAILABLE = False
+
+# Optional nvJPEG encoder (torchvision on CUDA), opt-in with JPEG_ENCODER=nvjpeg
+NVJPEG_AVAILABLE = False
+if os.environ.get("JPEG_ENCODER", "").lower() == "nvjpeg":
+    try:
+        import torch
+        from torchvision.io import encode_jpeg as _tv_encode_jpeg
+        NVJPEG_AVAILABLE = torch.cuda.is_available()
+    except ImportError:
+        pass
+
+def fast_b64decode(data: str) -> bytes:
+    """Decode base64 (with or without a data: URI prefix) using the SIMD codec when available."""
+    if data.startswith("data:"):
+        data = data.partition(",")[2]
+    if PYBASE64_AVAILABLE:
+        return pybase64.b64decode(data, validate=False)
+    return base64.b64decode(data)
+
+def fast_b64encode(data) -> str:
+    """Base64-encode a bytes-like object to an ASCII string using the SIMD codec when available."""
+    if PYBASE64_AVAILABLE:
+        return pybase64.b64encode_as_string(data)
+    return base64.b64encode(data).decode("ascii")
+
+# libjpeg can decode directly at 1/2, 1/4 or 1/8 scale (DCT scaling)
+_REDUCED_DECODE_FLAGS = ((8, "IMREAD_REDUCED_COLOR_8"), (4, "IMREAD_REDUCED_COLOR_4"), (2, "IMREAD_REDUCED_COLOR_2"))
+
+def image_size(image_bytes: bytes) -> Optional[Tuple[int, int]]:
+    """(width, height) of encoded image bytes from the header alone, or None if unreadable."""
+    try:
+        return Image.open(io.BytesIO(image_bytes)).size
+    except Exception:
+        return None
 
-def preprocess_image(image: Image.Image, target_size: tuple = (224, 224)) -> Image.Image:
-    image = image.resize(target_size, Image.Resampling.LANCZOS)
+def _decode_flag(image_bytes: bytes, min_side: Optional[int]) -> int:
+    """Largest JPEG reduction that keeps the longest side >= min_side (header read only)."""
+    if min_side is None or not image_bytes.startswith(b"\xff\xd8"):
+        return cv2.IMREAD_COLOR
+    size = image_size(image_bytes)
+    if size is None:
+        return cv2.IMREAD_COLOR
+    longest = max(size)
+    for factor, flag in _REDUCED_DECODE_FLAGS:
+        if longest // factor >= min_side:
+            return getattr(cv2, flag)
+    return cv2.IMREAD_COLOR
+
+def decode_image_bytes(image_bytes: bytes, min_side: Optional[int] = None) -> np.ndarray:
+    """
+    Decode encoded image bytes straight to a BGR uint8 array (no PIL intermediate).
+    With `min_side`, large JPEGs are decoded at a reduced scale that still keeps
+    the longest side >= min_side, skipping most of the full-resolution decode.
+    """
+    image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), _decode_flag(image_bytes, min_side))
+    if image is None:
+        raise ValueError("Could not decode image data")
     return image
 
+def decode_base64_image(image_data: str) -> np.ndarray:
+    return decode_image_bytes(fast_b64decode(image_data))
+
+def fit_within(image: np.ndarray, max_side: int) -> np.ndarray:
+    """Downscale (aspect-preserving, INTER_AREA) so neither side exceeds max_side; returns the input if it already fits."""
+    h, w = image.shape[:2]
+    if max(h, w) <= max_side:
+        return image
+    scale = max_side / max(h, w)
+    size = (max(1, round(w * scale)), max(1, round(h * scale)))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+def preprocess_image(image: np.ndarray, target_size: tuple = (224, 224)) -> np.ndarray:
+    return np.ascontiguousarray(cv2.resize(image, target_size, interpolation=cv2.INTER_AREA))
+
 def image_to_numpy(image: Image.Image) -> np.ndarray:
     arr = np.array(image, dtype=np.float32)
     arr = arr / 255.0
     return arr
+
+def _encode_jpeg_gpu(frame: np.ndarray, quality: int) -> bytes:
+    """Encode on the GPU with nvJPEG; the BGR->RGB swap and CHW layout happen on device."""
+    tensor = torch.from_numpy(np.ascontiguousarray(frame)).to("cuda", non_blocking=True)
+    tensor = tensor.flip(-1).permute(2, 0, 1).contiguous()
+    return _tv_encode_jpeg(tensor, quality=quality).cpu().numpy().tobytes()
+
+def encode_png(frame: np.ndarray) -> bytes:
+    """Encode a BGR frame to lossless PNG bytes via OpenCV."""
+    ok, encoded = cv2.imencode(".png", frame)
+    if not ok:
+        raise ValueError("Could not encode image as PNG")
+    return encoded.tobytes()
+
+def encode_jpeg(frame: np.ndarray, quality: int = 85) -> bytes:
+    """Encode a BGR frame to JPEG bytes, preferring nvJPEG (if enabled) then libjpeg-turbo via simplejpeg."""
+    if NVJPEG_AVAILABLE:
+        try:
+            return _encode_jpeg_gpu(frame, quality)
+        except Exception as e:
+            print(f"nvJPEG encode failed, using CPU encoder: {e}")
+    if SIMPLEJPEG_AVAILABLE:
+        return simplejpeg.encode_jpeg(np.ascontiguousarray(frame), quality=quality, colorspace="BGR")
+    _, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return jpeg.tobytes()
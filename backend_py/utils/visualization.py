@@ -2,31 +2,40 @@
 Visualization utilities for disease analysis results.
 Now uses actual detected disease regions instead of generic color detection.
 """
+import io
+from typing import Union
+
 import cv2
 import numpy as np
 from PIL import Image
-import io
-import base64
 
+from utils.image_processing import encode_jpeg, encode_png, fast_b64encode
+
+
+def overlay_style(analysis: dict) -> tuple:
+    """The result fields the overlay colours depend on: (is_healthy, severity)."""
+    return analysis.get("is_healthy", False), analysis.get("severity", "medium")
 
-def draw_disease_regions(image: Image.Image, analysis: dict) -> Image.Image:
+
+def draw_disease_regions(image: Union[Image.Image, np.ndarray], analysis: dict) -> np.ndarray:
     """
     Draw precise bounding boxes around detected disease regions.
     
     Args:
-        image: Original PIL Image
+        image: Original PIL Image or BGR uint8 array (left untouched)
         analysis: Detection result containing 'disease_regions' list
         
     Returns:
-        PIL Image with disease regions marked
+        BGR array with disease regions marked
     """
-    img_np = np.array(image.convert("RGB"))
-    img_bgr = cv2.cvtColor(img_np, cv2.COLOR_RGB2BGR)
+    if isinstance(image, np.ndarray):
+        img_bgr = image.copy()
+    else:
+        img_bgr = cv2.cvtColor(np.array(image.convert("RGB")), cv2.COLOR_RGB2BGR)
     height, width = img_bgr.shape[:2]
     
     disease_regions = analysis.get("disease_regions", [])
-    is_healthy = analysis.get("is_healthy", False)
-    severity = analysis.get("severity", "medium")
+    is_healthy, severity = overlay_style(analysis)
     
     # Color scheme based on severity
     if is_healthy:
@@ -85,25 +94,30 @@ def draw_disease_regions(image: Image.Image, analysis: dict) -> Image.Image:
         cv2.rectangle(img_bgr, (text_x - 8, text_y - text_h - 6), (text_x + text_w + 8, text_y + 6), box_color, -1)
         cv2.putText(img_bgr, text, (text_x, text_y), font, 0.6, (255, 255, 255), 2)
     
-    # Convert back to RGB
-    img_rgb = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
-    return Image.fromarray(img_rgb)
+    return img_bgr
 
 
 def image_to_base64(image: Image.Image, format: str = "PNG") -> str:
     """Convert PIL Image to base64 string."""
     buffer = io.BytesIO()
     image.save(buffer, format=format)
-    return base64.b64encode(buffer.getvalue()).decode("utf-8")
+    return fast_b64encode(buffer.getbuffer())
+
+
+def array_to_base64(image: np.ndarray, format: str = "PNG", quality: int = 80) -> str:
+    """Encode a BGR array (PNG via OpenCV, JPEG via libjpeg-turbo) and return base64 of the bytes."""
+    if format.upper() in ("JPEG", "JPG"):
+        return fast_b64encode(encode_jpeg(image, quality=quality))
+    return fast_b64encode(encode_png(image))
 
 
-def process_and_visualize(image: Image.Image, analysis: dict) -> tuple:
+def process_and_visualize(image: Union[Image.Image, np.ndarray], analysis: dict, format: str = "PNG") -> tuple:
     """
     Main entry point: visualize detection results on image.
     
     Returns:
-        (processed_image, base64_string)
+        (processed_bgr_array, base64_string) - base64 is PNG or JPEG per `format`
     """
     processed = draw_disease_regions(image, analysis)
-    b64 = image_to_base64(processed)
+    b64 = array_to_base64(processed, format)
     return processed, b64
@@ -43,12 +43,11 @@ export default function BirdDetectorPage() {
         setIsUploading(true);
 
         try {
-            const formData = new FormData();
-            formData.append('file', file);
-
-            const response = await fetch('http://localhost:8000/api/bird/upload', {
+            // Send the raw file as the body; the backend streams it to disk
+            const response = await fetch(`http://localhost:8000/api/bird/upload?filename=${encodeURIComponent(file.name)}`, {
                 method: 'POST',
-                body: formData,
+                headers: { 'Content-Type': 'application/octet-stream' },
+                body: file,
             });
 
             if (!response.ok) {
@@ -0,0 +1,73 @@
+import asyncio
+import os
+import sys
+
+# Add backend_py to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../backend_py')))
+
+from services.batch_queue import AsyncBatchQueue
+
+
+async def _with_queue(queue, body):
+    worker = asyncio.create_task(queue.process_loop())
+    await asyncio.sleep(0)  # let process_loop create its queue
+    try:
+        return await body()
+    finally:
+        worker.cancel()
+
+
+def test_requests_are_batched():
+    batches = []
+
+    def double(items):
+        batches.append(list(items))
+        return [item * 2 for item in items]
+
+    queue = AsyncBatchQueue(double, max_batch_size=4, max_wait_time=0.05)
+
+    async def body():
+        return await asyncio.gather(*(queue.add_request(i) for i in range(6)))
+
+    results = asyncio.run(_with_queue(queue, body))
+    assert results == [0, 2, 4, 6, 8, 10]
+    assert batches == [[0, 1, 2, 3], [4, 5]]
+
+
+def test_exception_reaches_every_waiter():
+    calls = []
+
+    def flaky(items):
+        calls.append(len(items))
+        if len(calls) == 1:
+            raise ValueError("inference failed")
+        return list(items)
+
+    queue = AsyncBatchQueue(flaky, max_batch_size=8, max_wait_time=0.05)
+
+    async def body():
+        outcomes = await asyncio.gather(*(queue.add_request(i) for i in range(3)),
+                                        return_exceptions=True)
+        # The loop keeps serving after a failed batch
+        return outcomes, await queue.add_request("next")
+
+    outcomes, after = asyncio.run(_with_queue(queue, body))
+    assert calls[0] == 3
+    assert all(isinstance(o, ValueError) and str(o) == "inference failed" for o in outcomes)
+    assert after == "next"
+
+
+def test_add_request_requires_running_loop():
+    queue = AsyncBatchQueue(list)
+    try:
+        asyncio.run(queue.add_request(1))
+    except RuntimeError:
+        return
+    raise AssertionError("add_request should fail before process_loop() starts")
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,68 @@
+import os
+import sys
+
+# Add backend_py to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../backend_py')))
+
+from utils import cache as cache_module
+from utils.cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+def _with_clock(test):
+    clock = FakeClock()
+    saved = cache_module.time
+    cache_module.time = clock
+    try:
+        test(clock)
+    finally:
+        cache_module.time = saved
+
+
+def test_entries_expire_after_ttl():
+    def run(clock):
+        cache = TTLCache(maxsize=8, ttl=10.0)
+        cache.set("leaf", "blight")
+        clock.now += 9.9
+        assert cache.get("leaf") == "blight"
+        clock.now += 0.2
+        assert cache.get("leaf", "expired") == "expired"
+        assert len(cache) == 0  # expired entries are dropped on access
+
+    _with_clock(run)
+
+
+def test_set_refreshes_expiry():
+    def run(clock):
+        cache = TTLCache(maxsize=8, ttl=10.0)
+        cache.set("leaf", "blight")
+        clock.now += 8
+        cache.set("leaf", "rust")
+        clock.now += 8
+        assert cache.get("leaf") == "rust"
+
+    _with_clock(run)
+
+
+def test_least_recently_used_is_evicted():
+    cache = TTLCache(maxsize=2, ttl=60.0)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")
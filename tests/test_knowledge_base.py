@@ -0,0 +1,119 @@
+import json
+import os
+import sys
+import tempfile
+
+# Add backend_py to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../backend_py')))
+
+from services import knowledge_base as kb_module
+from services.knowledge_base import KeywordIndex, KnowledgeBase
+
+ENTRIES = [
+    ("tomato", ["tomato", "टमाटर"]),
+    ("potato", ["potato", "aloo", "tomato"]),   # "tomato" is owned by the first entry
+    ("rice", ["rice", "paddy", "paddy"]),
+    ("wheat", ["wheat", "gehun"]),
+]
+
+TEXTS = [
+    "my tomato leaves have spots",
+    "aloo and paddy fields",
+    "टमाटर के पत्ते पीले हैं",
+    "potatomato",                 # overlapping keywords: earliest entry wins
+    "wheat after rice",
+    "nothing to see here",
+    "",
+]
+
+
+def _expected(entries, text):
+    for key, keywords in entries:
+        if any(kw in text for kw in keywords):
+            return key
+    return None
+
+
+def _backends():
+    backends = ["plain"]
+    if kb_module.AHOCORASICK_AVAILABLE:
+        backends.append("ahocorasick")
+    if kb_module.HYPERSCAN_AVAILABLE:
+        backends.append("hyperscan")
+    return backends
+
+
+def _index(backend, entries):
+    saved = kb_module.HYPERSCAN_AVAILABLE, kb_module.AHOCORASICK_AVAILABLE
+    kb_module.HYPERSCAN_AVAILABLE = backend == "hyperscan"
+    kb_module.AHOCORASICK_AVAILABLE = backend == "ahocorasick"
+    try:
+        return KeywordIndex(entries)
+    finally:
+        kb_module.HYPERSCAN_AVAILABLE, kb_module.AHOCORASICK_AVAILABLE = saved
+
+
+def test_backends_return_same_matches():
+    for backend in _backends():
+        index = _index(backend, ENTRIES)
+        for text in TEXTS:
+            assert index.first_match(text) == _expected(ENTRIES, text), (backend, text)
+
+
+def test_empty_keyword_matches_every_text():
+    entries = [("blight", ["blight"]), ("general", [""]), ("rust", ["rust"])]
+    for backend in _backends():
+        index = _index(backend, entries)
+        assert index.first_match("leaf blight and rust") == "blight", backend
+        assert index.first_match("rust") == "general", backend
+        assert index.first_match("") == "general", backend
+
+
+def _write_kb(directory, data):
+    path = os.path.join(directory, "agricultural_knowledge.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    return path
+
+
+def test_stale_msgpack_is_rebuilt():
+    if not kb_module.MSGPACK_AVAILABLE:
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        path = _write_kb(tmp, {"crops": {"wheat": {"names": ["gehun"]}}})
+        packed = kb_module._msgpack_path(path)
+        kb_module._write_msgpack(packed, {"crops": {"rice": {"names": ["paddy"]}}})
+        json_mtime = os.path.getmtime(path)
+        os.utime(packed, (json_mtime - 60, json_mtime - 60))
+
+        kb = KnowledgeBase.load(path)
+        assert list(kb.crops) == ["wheat"]
+        assert os.path.getmtime(packed) >= json_mtime
+
+        # The rebuilt file is what the next load reads
+        os.remove(path)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("not json")
+        os.utime(path, (json_mtime, json_mtime))
+        os.utime(packed, (json_mtime + 1, json_mtime + 1))
+        assert KnowledgeBase.load(path).crop_index.first_match("gehun flour") == "wheat"
+
+
+def test_fresh_msgpack_is_preferred():
+    if not kb_module.MSGPACK_AVAILABLE:
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        path = _write_kb(tmp, {"crops": {"wheat": {}}})
+        packed = kb_module._msgpack_path(path)
+        kb_module._write_msgpack(packed, {"crops": {"rice": {}}})
+        json_mtime = os.path.getmtime(path)
+        os.utime(packed, (json_mtime + 60, json_mtime + 60))
+
+        assert list(KnowledgeBase.load(path).crops) == ["rice"]
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")
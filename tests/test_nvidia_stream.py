@@ -0,0 +1,85 @@
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+# Add backend_py to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../backend_py')))
+
+from services.nvidia_vision import NvidiaVisionService
+
+
+class FakeStream:
+    """Async chat-completion stream yielding one delta per chunk."""
+
+    def __init__(self, deltas):
+        self.deltas = deltas
+        self.consumed = 0
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.consumed == len(self.deltas):
+            raise StopAsyncIteration
+        delta = self.deltas[self.consumed]
+        self.consumed += 1
+        return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=delta))])
+
+    async def close(self):
+        self.closed = True
+
+
+def _read(deltas):
+    stream = FakeStream(deltas)
+    text, result = asyncio.run(NvidiaVisionService()._read_stream(stream))
+    return stream, text, result
+
+
+def test_fenced_json_stops_at_closing_brace():
+    stream, text, result = _read([
+        "```json\n",
+        '{"disease_name": "Early Blight", ',
+        '"confidence": 90}',
+        "\n```",
+        "\nLet me know if you need anything else.",
+    ])
+    assert result == {"disease_name": "Early Blight", "confidence": 90}
+    assert stream.consumed == 3
+    assert stream.closed
+    assert text.startswith("```json")
+
+
+def test_brace_inside_string():
+    stream, _, result = _read([
+        '{"description": "spots {like',
+        ' rings}',
+        ' on older leaves", "crop_identified": "Tomato"}',
+        " trailing prose",
+    ])
+    assert result == {"description": "spots {like rings} on older leaves",
+                      "crop_identified": "Tomato"}
+    assert stream.consumed == 3
+
+
+def test_no_json_falls_back_to_text():
+    stream, text, result = _read(["**Crop Identified**: Tomato\n", "**Disease Name**: Early Blight  "])
+    assert result is None
+    assert text == "**Crop Identified**: Tomato\n**Disease Name**: Early Blight"
+    assert stream.consumed == 2
+    assert stream.closed
+
+
+def test_empty_object_reads_whole_reply():
+    stream, text, result = _read(["{}", ' then {"crop_identified": "Rice"}'])
+    assert result is None
+    assert stream.consumed == 2
+    assert text == '{} then {"crop_identified": "Rice"}'
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")
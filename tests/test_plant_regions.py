@@ -0,0 +1,71 @@
+import os
+import sys
+
+import cv2
+import numpy as np
+
+# Add backend_py to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../backend_py')))
+
+from models.yolo_detector import PlantDiseaseDetector
+
+LEAF = (40, 160, 40)   # BGR, inside the green range
+SPOT = (10, 10, 10)    # dark enough for the dark-spot mask
+
+
+def _leaf(size=400):
+    # 400x400 stays under ANALYSIS_MAX_SIDE, so boxes are in image pixels;
+    # the 0.3% region threshold is 480 px
+    return np.full((size, size, 3), LEAF, np.uint8)
+
+
+def _regions(img):
+    return PlantDiseaseDetector().detect(img)["disease_regions"]
+
+
+def test_region_area_is_outline_area():
+    # A thin ring has far fewer than 480 pixels, but its outline encloses
+    # ~2800 px, so it counts as a region (contourArea semantics)
+    img = _leaf()
+    cv2.circle(img, (100, 100), 30, SPOT, 1)
+    regions = _regions(img)
+    assert len(regions) == 1
+    assert regions[0] == {"x": 70, "y": 70, "w": 61, "h": 61}
+
+
+def test_small_spots_are_ignored():
+    img = _leaf()
+    cv2.circle(img, (100, 100), 10, SPOT, -1)   # ~314 px, below threshold
+    cv2.circle(img, (300, 300), 20, SPOT, -1)   # ~1256 px, above threshold
+    assert _regions(img) == [{"x": 280, "y": 280, "w": 41, "h": 41}]
+
+
+def test_spot_inside_ring_is_not_reported():
+    # Only outermost outlines count, as with findContours(RETR_EXTERNAL)
+    img = _leaf()
+    cv2.circle(img, (200, 200), 60, SPOT, 2)
+    cv2.circle(img, (200, 200), 20, SPOT, -1)
+    cv2.circle(img, (60, 340), 25, SPOT, -1)
+    regions = _regions(img)
+    assert len(regions) == 2
+    assert {"x": 139, "y": 139, "w": 123, "h": 123} in regions
+
+
+def test_regions_keep_find_contours_order():
+    # The left block starts a row lower but is labelled first; the overlay's
+    # #N numbering follows findContours, which reports it first as well
+    img = _leaf(200)
+    img[1:61, 2:61] = SPOT
+    img[0:61, 80:141] = SPOT
+    mask = cv2.inRange(img, SPOT, SPOT)
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    expected = [dict(zip("xywh", cv2.boundingRect(c))) for c in contours]
+    assert _regions(img) == expected
+    assert expected[0]["x"] == 2
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")